@@ -2,13 +2,13 @@ from django.contrib import admin
 
 from recipes.models import (
     FavoriteRecipe, Ingredient, IngredientsRecipe,
-    Recipe, ShoppingCartRecipe, Tag
+    Recipe, ShoppingCartRecipe, ShoppingListItem, Tag
     )
 from users.models import Follow, User
 
 models = [
     Tag, IngredientsRecipe,
-    FavoriteRecipe, ShoppingCartRecipe,
+    FavoriteRecipe, ShoppingCartRecipe, ShoppingListItem,
     ]
 
 admin.site.register(models)
@@ -39,17 +39,13 @@ class FollowAdmin(admin.ModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Представляет модель Recipe в интерфейсе администратора."""
-    list_display = ('id', 'name', 'author', 'is_favorited')
+    list_display = ('id', 'name', 'author', 'favorites_count', 'cart_count')
     search_fields = ('author', 'name', 'tags')
     list_filter = ('author', 'name', 'tags')
+    list_select_related = ('author',)
     inlines = (IngredientRecipeInline,)
     empty_value_display = '-пусто-'
 
-    def is_favorited(self, obj):
-        return FavoriteRecipe.objects.filter(recipe=obj).count()
-
-    is_favorited.short_description = 'Кол-во в избранном'
-
 
 @admin.register(Ingredient)
 class Ingredient(admin.ModelAdmin):
@@ -0,0 +1,188 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connections
+from rest_framework.response import Response
+
+from .metrics import recording
+from . import response_cache
+from .relations import REQUEST_ATTR, UserRelations
+from .response_cache import AnonymousResponseCacheMixin
+from .serializers import SubscribeSerializer
+from .views import (
+    IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet,
+    get_subscriptions_queryset
+    )
+
+if not connections['default'].settings_dict['CONN_MAX_AGE']:
+    raise ImproperlyConfigured(
+        'Асинхронным GET нужен DB_CONN_MAX_AGE больше 0: иначе каждый '
+        'вызов в пуле потоков открывает новое соединение с БД.'
+    )
+
+
+def in_thread(request, func, *args, **kwargs):
+    """Выполнить синхронную функцию в общем пуле потоков.
+
+    Вызовы не привязаны к потоку запроса и идут параллельно, SQL-запросы
+    учитываются в request.query_recorder. У каждого потока пула свое
+    соединение с БД; оно переиспользуется, пока не истек CONN_MAX_AGE,
+    поэтому без него модуль не загружается. Соединений у процесса
+    бывает столько же, сколько потоков в пуле, — max_connections
+    PostgreSQL или пул вроде PgBouncer должны это выдерживать.
+    """
+    recorder = getattr(request, 'query_recorder', None)
+
+    def call():
+        try:
+            if recorder is None:
+                return func(*args, **kwargs)
+            with recording(recorder):
+                return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+def page_rows(view):
+    return view.paginate_queryset(view.filter_queryset(view.get_queryset()))
+
+
+def page_response(view, rows):
+    serializer = view.get_serializer(rows, many=True)
+    return view.get_paginated_response(serializer.data)
+
+
+def object_response(view, obj):
+    return Response(view.get_serializer(obj).data)
+
+
+def subscription_rows(view):
+    return view.paginate_queryset(get_subscriptions_queryset(view.request))
+
+
+def subscription_response(view, rows):
+    serializer = SubscribeSerializer(
+        rows, many=True, context=view.get_serializer_context()
+    )
+    return view.get_paginated_response(serializer.data)
+
+
+PAGE = (page_rows, page_response)
+OBJECT = (lambda view: view.get_object(), object_response)
+SUBSCRIPTIONS = (subscription_rows, subscription_response)
+
+
+async def build(view, reader, request):
+    """Ответ из строк и связей пользователя, загруженных одновременно."""
+    load_rows, respond = reader
+    rows, relations = await asyncio.gather(
+        in_thread(request, load_rows, view),
+        in_thread(request, UserRelations.load, request.user),
+    )
+    setattr(request, REQUEST_ATTR, relations)
+    return await in_thread(request, respond, view, rows)
+
+
+async def read(viewset, basename, action, reader, request, kwargs):
+    """GET-действие вьюсета, как в APIView.dispatch(), но асинхронно.
+
+    Сериализация и рендеринг тоже идут в пуле потоков, анонимным
+    посетителям ответ по возможности отдается из кеша ответов.
+    """
+    view = viewset(
+        basename=basename,
+        detail=action == 'retrieve',
+        action_map={'get': action},
+    )
+    view.args, view.kwargs = (), kwargs
+    request = view.initialize_request(request, **kwargs)
+    view.request = request
+    view.headers = view.default_response_headers
+    try:
+        await in_thread(request, view.initial, request)
+        if not (isinstance(view, AnonymousResponseCacheMixin)
+                and request.user.is_anonymous):
+            response = await build(view, reader, request)
+        else:
+            response, locked = await in_thread(
+                request, response_cache.lookup, request
+            )
+            if response is None:
+                try:
+                    response = await in_thread(
+                        request, response_cache.store, request,
+                        await build(view, reader, request),
+                    )
+                finally:
+                    if locked:
+                        await in_thread(
+                            request, response_cache.release, request
+                        )
+    except Exception as exc:
+        response = view.handle_exception(exc)
+    response = view.finalize_response(request, response)
+    if hasattr(response, 'render'):
+        response = await in_thread(request, response.render)
+    return response
+
+
+def async_read_view(viewset, basename, actions, detail=False, reader=None):
+    """Асинхронная вьюха для маршрута вьюсета.
+
+    GET с reader — парой (загрузка строк, ответ) — обрабатывается read(),
+    без него синхронный вьюсет целиком выполняется в пуле потоков.
+    Прочие методы идут синхронному вьюсету в потоке запроса, как и
+    без ASGI.
+    """
+    sync_view = viewset.as_view(actions, basename=basename, detail=detail)
+    action = actions['get']
+
+    async def view(request, **kwargs):
+        if request.method != 'GET':
+            return await sync_to_async(sync_view)(request, **kwargs)
+        if reader is not None:
+            return await read(
+                viewset, basename, action, reader, request, kwargs
+            )
+        response = await in_thread(request, sync_view, request, **kwargs)
+        if hasattr(response, 'render'):
+            await in_thread(request, response.render)
+        return response
+
+    view.csrf_exempt = True
+    view.actions = actions
+    view.initkwargs = {'basename': basename, 'detail': detail}
+    return view
+
+
+recipe_list = async_read_view(
+    RecipeViewSet, 'recipes', {'get': 'list', 'post': 'create'},
+    reader=PAGE,
+)
+recipe_detail = async_read_view(
+    RecipeViewSet, 'recipes',
+    {
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    },
+    detail=True,
+    reader=OBJECT,
+)
+tag_list = async_read_view(TagViewSet, 'tags', {'get': 'list'})
+tag_detail = async_read_view(
+    TagViewSet, 'tags', {'get': 'retrieve'}, detail=True
+)
+ingredient_list = async_read_view(
+    IngredientViewSet, 'ingredients', {'get': 'list'}
+)
+ingredient_detail = async_read_view(
+    IngredientViewSet, 'ingredients', {'get': 'retrieve'}, detail=True
+)
+subscriptions = async_read_view(
+    UserViewSet, 'users', {'get': 'subscriptions'}, reader=SUBSCRIPTIONS
+)
@@ -0,0 +1,85 @@
+import pickle
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+CACHE_KEY = 'auth:token:{key}'
+
+_local_cache = {}
+
+
+def invalidate_token(key):
+    """Забыть пользователя, закешированного для токена."""
+    _local_cache.pop(key, None)
+    cache.delete(CACHE_KEY.format(key=key))
+
+
+def remember(key, data, now):
+    """Положить пользователя в кеш процесса не больше чем на
+    TOKEN_LOCAL_CACHE_SIZE токенов.
+
+    Когда кеш заполнен, сначала удаляются истекшие записи, а если их
+    нет, то самые старые.
+    """
+    _local_cache.pop(key, None)
+    if len(_local_cache) >= settings.TOKEN_LOCAL_CACHE_SIZE:
+        for old_key, (expires, _data) in list(_local_cache.items()):
+            if expires <= now:
+                del _local_cache[old_key]
+        while len(_local_cache) >= settings.TOKEN_LOCAL_CACHE_SIZE:
+            del _local_cache[next(iter(_local_cache))]
+    _local_cache[key] = (now + settings.TOKEN_LOCAL_CACHE_TIMEOUT, data)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кешем token -> user.
+
+    Пользователь хранится в памяти процесса (TOKEN_LOCAL_CACHE_TIMEOUT)
+    и в общем кеше (TOKEN_CACHE_TIMEOUT), так что запросу не нужен JOIN
+    authtoken_token и users_user. Записи удаляются при выходе, смене
+    пароля и деактивации пользователя, в остальных процессах кеш в памяти
+    устаревает не позже чем через TOKEN_LOCAL_CACHE_TIMEOUT секунд и
+    хранит не больше TOKEN_LOCAL_CACHE_SIZE токенов.
+    Каждый запрос получает свою копию пользователя.
+
+    Счетчик followers_count не загружается: у пользователя с отложенным
+    полем save() пишет только загруженные поля, так что сохранение
+    закешированного пользователя (PATCH users/me, смена пароля) не
+    затирает счетчик, который меняется UPDATE с F().
+    """
+
+    def get_user(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').defer(
+                'user__followers_count'
+            ).get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return token.user
+
+    def authenticate_credentials(self, key):
+        now = time.monotonic()
+        entry = _local_cache.get(key)
+        if entry is not None and entry[0] > now:
+            data = entry[1]
+        else:
+            data = cache.get(CACHE_KEY.format(key=key))
+            if data is None:
+                data = pickle.dumps(self.get_user(key))
+                cache.set(
+                    CACHE_KEY.format(key=key),
+                    data,
+                    timeout=settings.TOKEN_CACHE_TIMEOUT,
+                )
+            remember(key, data, now)
+        user = pickle.loads(data)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return (user, self.get_model()(key=key, user=user))
@@ -0,0 +1,104 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+VERSION_KEY = 'reference:{name}:version'
+ENTRY_KEY = 'reference:{name}:{version}:{path}'
+LOCAL_CACHE_SIZE = 1024
+
+_local_cache = {}
+
+
+def get_version(name):
+    """Текущая версия справочника в общем кеше.
+
+    Новая версия берется из текущего времени: если ключ версии вытеснен
+    из кеша, она не совпадет со старыми записями.
+    """
+    key = VERSION_KEY.format(name=name)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate(name):
+    """Сбросить кеш справочника, увеличив его версию."""
+    key = VERSION_KEY.format(name=name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_entry(name, path):
+    """Найти (etag, content) сначала в памяти процесса, затем в общем кеше."""
+    version = get_version(name)
+    local_key = (name, version, path)
+    entry = _local_cache.get(local_key)
+    if entry is None:
+        path_hash = hashlib.md5(path.encode()).hexdigest()
+        entry = cache.get(
+            ENTRY_KEY.format(name=name, version=version, path=path_hash)
+        )
+        if entry is not None:
+            set_local(local_key, entry)
+    return local_key, entry
+
+
+def set_local(local_key, entry):
+    if len(_local_cache) >= LOCAL_CACHE_SIZE:
+        _local_cache.clear()
+    _local_cache[local_key] = entry
+
+
+def set_entry(local_key, data):
+    """Сохранить сериализованный ответ в оба уровня кеша."""
+    name, version, path = local_key
+    content = JSONRenderer().render(data)
+    entry = (f'"{hashlib.md5(content).hexdigest()}"', content)
+    path_hash = hashlib.md5(path.encode()).hexdigest()
+    cache.set(
+        ENTRY_KEY.format(name=name, version=version, path=path_hash),
+        entry,
+        timeout=settings.REFERENCE_CACHE_TIMEOUT,
+    )
+    set_local(local_key, entry)
+    return entry
+
+
+class ReferenceCacheMixin:
+    """Кеширует готовый JSON справочника с поддержкой ETag.
+
+    Повторный запрос не обращается ни к ORM, ни к сериализатору.
+    """
+    cache_name = None
+
+    def cached_response(self, request, view, *args, **kwargs):
+        local_key, entry = get_entry(self.cache_name, request.get_full_path())
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = set_entry(local_key, response.data)
+        etag, content = entry
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
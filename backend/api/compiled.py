@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+
+from recipes.models import IngredientsRecipe, Recipe, Tag
+from .images import thumbnail_name
+from .relations import get_relations
+
+RECIPE_FIELDS = (
+    'id', 'name', 'image', 'text', 'cooking_time', 'has_thumbnails',
+    'author_id', 'author__email', 'author__username',
+    'author__first_name', 'author__last_name',
+)
+
+
+class CompiledRecipeSerializer:
+    """Только чтение: то же, что RecipeSerializer, из строк .values().
+
+    Вместо вложенных сериализаторов теги и ингредиенты страницы
+    загружаются двумя запросами values_list() и собираются в словари
+    с теми же ключами и в том же порядке, что и у RecipeSerializer.
+    """
+
+    def __init__(self, instance=None, many=False, context=None):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @property
+    def data(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        data = self.to_representation(rows)
+        return data if self.many else data[0]
+
+    def image_url(self, row, storage=Recipe._meta.get_field('image').storage):
+        """Ссылка на изображение, как в Base64ImageField."""
+        name = row['image']
+        if not name:
+            return None
+        variant = self.context.get('image_variant')
+        if variant and row['has_thumbnails']:
+            url = default_storage.url(thumbnail_name(name, variant))
+        else:
+            url = storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, rows):
+        ids = [row['id'] for row in rows]
+        tags = defaultdict(list)
+        for recipe_id, *tag in Tag.objects.filter(
+                recipe__in=ids
+        ).values_list('recipe', 'id', 'name', 'color', 'slug'):
+            tags[recipe_id].append(
+                dict(zip(('id', 'name', 'color', 'slug'), tag))
+            )
+        ingredients = defaultdict(list)
+        for recipe_id, *ingredient in IngredientsRecipe.objects.filter(
+                recipe__in=ids
+        ).values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'
+        ):
+            ingredients[recipe_id].append(dict(zip(
+                ('id', 'name', 'measurement_unit', 'amount'), ingredient
+            )))
+        relations = get_relations(self.context)
+        return [
+            {
+                'id': row['id'],
+                'tags': tags[row['id']],
+                'author': {
+                    'email': row['author__email'],
+                    'id': row['author_id'],
+                    'username': row['author__username'],
+                    'first_name': row['author__first_name'],
+                    'last_name': row['author__last_name'],
+                    'is_subscribed': row['author_id'] in relations.following,
+                },
+                'ingredients': ingredients[row['id']],
+                'is_favorited': row['id'] in relations.favorites,
+                'is_in_shopping_cart': row['id'] in relations.cart,
+                'name': row['name'],
+                'image': self.image_url(row),
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+            }
+            for row in rows
+        ]
@@ -0,0 +1,178 @@
+import csv
+import json
+
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 16
+PDF_LINES_PER_PAGE = 45
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+
+# Имена глифов кириллицы для кодировки cp1251 (байты 0xC0-0xFF).
+CYRILLIC_GLYPHS = ' '.join(
+    [f'/afii{code}' for code in range(10017, 10050) if code != 10023]
+    + [f'/afii{code}' for code in range(10065, 10098) if code != 10071]
+)
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer, который сразу отдает строку."""
+    def write(self, value):
+        return value
+
+
+class TextExport:
+    """Список покупок в виде текстового файла."""
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def render(self, ingredients):
+        empty = True
+        for ingredient in ingredients:
+            if empty:
+                empty = False
+                yield 'Список продуктов к покупке:\n'
+            yield (
+                f'☐ {ingredient["ingredient__name"].title()} '
+                f'({ingredient["ingredient__measurement_unit"]}) '
+                f'- {ingredient["ingredient_amount"]}\n'
+            )
+        if empty:
+            yield 'Ваш список покупок пуст\n'
+        else:
+            yield '\nПроект Foodgram от Gostinci\n'
+
+
+class CsvExport:
+    """Список покупок в формате CSV."""
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def render(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Единица измерения', 'Количество')
+        )
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['ingredient__measurement_unit'],
+                ingredient['ingredient_amount'],
+            ))
+
+
+class JsonExport:
+    """Список покупок в виде JSON-массива."""
+    content_type = 'application/json'
+    extension = 'json'
+
+    def render(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['ingredient_amount'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+class PdfExport:
+    """Список покупок в виде простого PDF без внешних зависимостей.
+
+    Текст набирается стандартным шрифтом Helvetica в кодировке cp1251,
+    кириллица отображается через таблицу Differences. Страницы пишутся
+    по мере чтения строк, в памяти держится только текущая страница.
+    """
+    content_type = 'application/pdf'
+    extension = 'pdf'
+
+    def render(self, ingredients):
+        self.offsets = {}
+        self.position = 0
+        self.page_ids = []
+        self.next_id = 4
+        yield self.write(b'%PDF-1.4\n')
+        yield self.write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        yield self.write_object(3, (
+            '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            '/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+            f'/Differences [168 /afii10023 184 /afii10071 '
+            f'192 {CYRILLIC_GLYPHS}] >> >>'
+        ).encode())
+        lines = ['Список продуктов к покупке:']
+        for ingredient in ingredients:
+            lines.append(
+                f'- {ingredient["ingredient__name"].title()} '
+                f'({ingredient["ingredient__measurement_unit"]}) '
+                f'- {ingredient["ingredient_amount"]}'
+            )
+            if len(lines) == PDF_LINES_PER_PAGE:
+                yield self.write_page(lines)
+                lines = []
+        if len(lines) == 1 and not self.page_ids:
+            lines = ['Ваш список покупок пуст']
+        if lines or not self.page_ids:
+            yield self.write_page(lines)
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        yield self.write_object(2, (
+            f'<< /Type /Pages /Kids [{kids}] '
+            f'/Count {len(self.page_ids)} >>'
+        ).encode())
+        yield self.write_trailer()
+
+    def write(self, data):
+        self.position += len(data)
+        return data
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        return self.write(
+            f'{object_id} 0 obj\n'.encode() + body + b'\nendobj\n'
+        )
+
+    def write_page(self, lines):
+        text = [
+            f'BT /F1 {PDF_FONT_SIZE} Tf {PDF_LINE_HEIGHT} TL '
+            f'{PDF_MARGIN} {PDF_PAGE_HEIGHT - PDF_MARGIN} Td'.encode()
+        ]
+        for line in lines:
+            escaped = (
+                line.replace('\\', '\\\\').replace('(', '\\(')
+                .replace(')', '\\)')
+            )
+            text.append(b'(' + escaped.encode('cp1251', 'replace') + b") '")
+        text.append(b'ET')
+        stream = b'\n'.join(text)
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        return self.write_object(
+            content_id,
+            f'<< /Length {len(stream)} >>\nstream\n'.encode()
+            + stream + b'\nendstream',
+        ) + self.write_object(page_id, (
+            f'<< /Type /Page /Parent 2 0 R '
+            f'/MediaBox [0 0 {PDF_PAGE_WIDTH} {PDF_PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 3 0 R >> >> '
+            f'/Contents {content_id} 0 R >>'
+        ).encode())
+
+    def write_trailer(self):
+        xref = self.position
+        size = self.next_id
+        rows = [f'xref\n0 {size}\n0000000000 65535 f \n']
+        for object_id in range(1, size):
+            rows.append(f'{self.offsets[object_id]:010d} 00000 n \n')
+        rows.append(
+            f'trailer\n<< /Size {size} /Root 1 0 R >>\n'
+            f'startxref\n{xref}\n%%EOF\n'
+        )
+        return self.write(''.join(rows).encode())
+
+
+EXPORT_FORMATS = {
+    export.extension: export
+    for export in (TextExport, CsvExport, JsonExport, PdfExport)
+}
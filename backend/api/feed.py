@@ -0,0 +1,160 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from recipes.models import FeedItem, Recipe
+from users.models import Follow, User
+
+BATCH_SIZE = 5000
+
+
+def fanned_out(author_id):
+    """Рассылаются ли рецепты автора по лентам подписчиков.
+
+    Рецепты авторов с FEED_FANOUT_LIMIT подписчиков и больше в ленты
+    не пишутся, а подмешиваются при чтении.
+    """
+    followers = User.objects.filter(
+        pk=author_id
+    ).values_list('followers_count', flat=True).first()
+    return (followers or 0) < settings.FEED_FANOUT_LIMIT
+
+
+def oldest_kept(user):
+    """Подзапрос: id рецепта последней из FEED_SIZE записей ленты.
+
+    Для неполной ленты подзапрос пуст.
+    """
+    return Subquery(FeedItem.objects.filter(
+        user=user
+    ).order_by('-recipe_id').values('recipe_id')[
+        settings.FEED_SIZE - 1:settings.FEED_SIZE
+    ])
+
+
+def trim(user_ids):
+    """Оставить в лентах пользователей не больше FEED_SIZE записей."""
+    FeedItem.objects.filter(
+        user__in=user_ids,
+        recipe_id__lt=oldest_kept(OuterRef('user')),
+    ).delete()
+
+
+def push_recipe(recipe):
+    """Записать новый рецепт в ленты подписчиков автора."""
+    if not fanned_out(recipe.author_id):
+        return
+    follower_ids = list(Follow.objects.filter(
+        following=recipe.author_id
+    ).values_list('user_id', flat=True))
+    if not follower_ids:
+        return
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(
+                user_id=user_id, recipe=recipe, author_id=recipe.author_id
+            )
+            for user_id in follower_ids
+        ),
+        ignore_conflicts=True,
+    )
+    trim(follower_ids)
+
+
+def backfill(user_id, author_ids=None):
+    """Дописать в ленту последние рецепты авторов.
+
+    Без author_ids берутся все авторы, на которых подписан пользователь.
+    """
+    if author_ids is None:
+        author_ids = Follow.objects.filter(
+            user=user_id
+        ).values('following_id')
+    recipes = Recipe.objects.filter(
+        author__in=author_ids,
+        author__followers_count__lt=settings.FEED_FANOUT_LIMIT,
+    ).order_by('-id').values_list('id', 'author_id')[:settings.FEED_SIZE]
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe_id=pk, author_id=author_id)
+            for pk, author_id in recipes
+        ),
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def follow(user, author):
+    if fanned_out(author.pk):
+        backfill(user.pk, [author.pk])
+
+
+def unfollow(user, author):
+    """Убрать рецепты автора из ленты пользователя.
+
+    Если после отписки у автора стало FEED_FANOUT_LIMIT - 1 подписчиков,
+    его рецепты снова рассылаются: fan_out_author() дописывает их в
+    ленты подписчиков после коммита, иначе рецепты, вышедшие без
+    рассылки, пропали бы из лент.
+    """
+    FeedItem.objects.filter(user=user, author=author).delete()
+    followers = User.objects.filter(
+        pk=author.pk
+    ).values_list('followers_count', flat=True).first()
+    if followers == settings.FEED_FANOUT_LIMIT - 1:
+        transaction.on_commit(partial(fan_out_author, author.pk))
+
+
+def fan_out_author(author_id):
+    """Дописать последние рецепты автора в ленты его подписчиков.
+
+    Каждому подписчику пишутся только рецепты, которые войдут в его
+    FEED_SIZE последних записей: в полную ленту — новее ее последней
+    записи. Так строк не больше, чем останется после trim().
+    """
+    recipe_ids = list(Recipe.objects.filter(
+        author=author_id
+    ).order_by('-id').values_list('id', flat=True)[:settings.FEED_SIZE])
+    if not recipe_ids:
+        return
+    with transaction.atomic():
+        followers = list(Follow.objects.filter(
+            following=author_id
+        ).annotate(
+            cutoff=oldest_kept(OuterRef('user'))
+        ).values_list('user_id', 'cutoff'))
+        FeedItem.objects.bulk_create(
+            (
+                FeedItem(user_id=user_id, recipe_id=pk, author_id=author_id)
+                for user_id, cutoff in followers
+                for pk in recipe_ids
+                if cutoff is None or pk > cutoff
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        trim([user_id for user_id, _ in followers])
+
+
+def feed_page(user, before=None, limit=10):
+    """id рецептов страницы ленты от новых к старым и есть ли следующая.
+
+    Страница выбирается по ключу: рецепты с id меньше before. Записи
+    ленты объединяются с рецептами авторов без рассылки.
+    """
+    items = FeedItem.objects.filter(user=user).order_by('-recipe_id')
+    pulled = Recipe.objects.filter(
+        author__in=Follow.objects.filter(
+            user=user,
+            following__followers_count__gte=settings.FEED_FANOUT_LIMIT,
+        ).values('following_id')
+    ).order_by('-id')
+    if before is not None:
+        items = items.filter(recipe_id__lt=before)
+        pulled = pulled.filter(id__lt=before)
+    ids = set(items.values_list('recipe_id', flat=True)[:limit + 1])
+    ids.update(pulled.values_list('id', flat=True)[:limit + 1])
+    ids = sorted(ids, reverse=True)
+    return ids[:limit], len(ids) > limit
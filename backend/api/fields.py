@@ -1,14 +1,69 @@
 import base64
+import binascii
+import tempfile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from PIL import Image
 from rest_framework import serializers
 
+from .images import thumbnail_name
+
+DECODE_CHUNK_SIZE = 64 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
-    """Поле для работы с изображением."""
+    """Поле для работы с изображением.
+
+    base64 декодируется по частям во временный файл; размер файла и
+    изображения проверяется до того, как Pillow распакует его целиком.
+    При чтении поле может вернуть уменьшенную копию: вариант задается
+    аргументом variant или ключом image_variant в контексте.
+    """
+    def __init__(self, *args, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, 'temp.' + ext)
         return super().to_internal_value(data)
+
+    def decode(self, imgstr, name):
+        if len(imgstr) * 3 // 4 > settings.IMAGE_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError('Слишком большой файл.')
+        output = tempfile.SpooledTemporaryFile(max_size=DECODE_CHUNK_SIZE)
+        try:
+            for start in range(0, len(imgstr), DECODE_CHUNK_SIZE):
+                output.write(base64.b64decode(
+                    imgstr[start:start + DECODE_CHUNK_SIZE], validate=True
+                ))
+        except binascii.Error:
+            raise serializers.ValidationError('Некорректный base64.')
+        output.seek(0)
+        try:
+            width, height = Image.open(output).size
+        except (OSError, Image.DecompressionBombError):
+            raise serializers.ValidationError(
+                self.error_messages['invalid_image']
+            )
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                'Слишком большое разрешение изображения.'
+            )
+        output.seek(0)
+        return File(output, name=name)
+
+    def to_representation(self, value):
+        variant = self.context.get('image_variant', self.variant)
+        instance = getattr(value, 'instance', None)
+        if not variant or not getattr(instance, 'has_thumbnails', False):
+            return super().to_representation(value)
+        url = default_storage.url(thumbnail_name(value.name, variant))
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
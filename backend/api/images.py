@@ -0,0 +1,92 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from recipes.models import Recipe
+from .response_cache import invalidate_recipes
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_VARIANTS = {
+    'small': 300,
+    'medium': 600,
+}
+
+_executor = None
+
+
+def thumbnail_name(name, variant):
+    """Путь уменьшенной копии изображения в хранилище."""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'thumbnails', f'{stem}_{variant}.webp')
+
+
+def make_thumbnails(name):
+    """Построить все уменьшенные копии изображения в формате WebP."""
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    for variant, width in THUMBNAIL_VARIANTS.items():
+        thumbnail = image
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            thumbnail = image.resize((width, height), Image.LANCZOS)
+        content = BytesIO()
+        thumbnail.save(content, 'WEBP', quality=80)
+        path = thumbnail_name(name, variant)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(content.getvalue()))
+    recipes = Recipe.objects.filter(image=name)
+    recipes.update(has_thumbnails=True)
+    invalidate_recipes(recipes.values_list('pk', flat=True))
+
+
+def process(name):
+    try:
+        make_thumbnails(name)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры для %s', name)
+
+
+def process_in_worker(name):
+    try:
+        process(name)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def schedule_thumbnails(recipe):
+    """Поставить построение миниатюр в очередь после коммита.
+
+    При THUMBNAIL_WORKERS = 0 миниатюры строятся сразу в текущем потоке.
+    """
+    if recipe.has_thumbnails or not recipe.image:
+        return
+    name = recipe.image.name
+    if settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(process_in_worker, name)
+        )
+    else:
+        transaction.on_commit(lambda: process(name))
@@ -0,0 +1,162 @@
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+from api.management.utils import percentile, rollback
+
+PNG = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+       'FcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+
+class Command(BaseCommand):
+    help = ('Замер основных эндпоинтов API: процентили времени ответа и '
+            'число SQL-запросов, результат сохраняется в JSON. Данные '
+            'создаются командой generate_data и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на каждый сценарий.')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--existing', action='store_true',
+                            help='Не создавать данные, мерить на текущих.')
+        parser.add_argument('--output', default='bench_api.json')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with rollback():
+            if not options['existing']:
+                call_command(
+                    'generate_data',
+                    users=options['users'],
+                    recipes=options['recipes'],
+                    prefix='bench-api',
+                    seed=options['seed'],
+                    stdout=self.stdout,
+                )
+            results = self.run(options)
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'options': {
+                name: options[name]
+                for name in ('requests', 'users', 'recipes', 'existing')
+            },
+            'scenarios': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'
+        ))
+
+    def run(self, options):
+        random.seed(options['seed'])
+        reader = User.objects.annotate(
+            follows=Count('follower')
+        ).order_by('-follows', 'id').first()
+        token, _ = Token.objects.get_or_create(user=reader)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        pages = max(1, len(recipe_ids) // 6)
+        created = []
+
+        def recipe_data():
+            return {
+                'name': 'Рецепт для замера',
+                'text': 'Описание',
+                'cooking_time': 30,
+                'tags': tag_ids[:2],
+                'ingredients': [
+                    {'id': pk, 'amount': random.randint(1, 500)}
+                    for pk, _ in random.sample(
+                        ingredients, min(8, len(ingredients))
+                    )
+                ],
+            }
+
+        def create():
+            data = dict(recipe_data(), image=PNG)
+            return client.post('/api/recipes/', data, format='json')
+
+        def update():
+            return client.patch(
+                f'/api/recipes/{random.choice(created)}/',
+                recipe_data(), format='json'
+            )
+
+        scenarios = {
+            'recipes_list': lambda: client.get(
+                f'/api/recipes/?page={random.randint(1, pages)}'
+            ),
+            'recipes_retrieve': lambda: client.get(
+                f'/api/recipes/{random.choice(recipe_ids)}/'
+            ),
+            'subscriptions': lambda: client.get(
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            'feed': lambda: client.get('/api/users/feed/'),
+            'download_shopping_cart': lambda: client.get(
+                '/api/recipes/download_shopping_cart/'
+            ),
+            'ingredient_search': lambda: client.get(
+                '/api/ingredients/',
+                {'name': random.choice(ingredients)[1][:3]},
+            ),
+            'recipe_create': create,
+            'recipe_update': update,
+        }
+        results = {}
+        try:
+            for name, request in scenarios.items():
+                results[name] = self.measure(
+                    name, request, options['requests'], created
+                )
+        finally:
+            for recipe in Recipe.objects.filter(pk__in=created):
+                recipe.image.delete(save=False)
+        return results
+
+    def measure(self, name, request, total, created):
+        timings, queries = [], []
+        for _ in range(total):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code < 300, response.content
+            if name == 'recipe_create':
+                created.append(response.data['id'])
+            queries.append(len(captured))
+        result = {
+            'requests': total,
+            'mean_ms': round(sum(timings) / total, 2),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p90_ms': round(percentile(timings, 0.9), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'max_ms': round(max(timings), 2),
+            'queries_p50': percentile(queries, 0.5),
+            'queries_max': max(queries),
+        }
+        self.stdout.write(
+            f'{name}: p50={result["p50_ms"]}ms p95={result["p95_ms"]}ms '
+            f'queries={result["queries_p50"]}'
+        )
+        return result
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from users.models import User
+from api.authentication import CachedTokenAuthentication
+from api.management.utils import rollback
+
+
+class Command(BaseCommand):
+    help = ('Сравнение стоимости аутентификации запроса по токену '
+            'с кешем и без него. Созданные записи откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with rollback():
+            self.run(options)
+
+    def run(self, options):
+        user = User.objects.create(
+            email='bench-auth@foodgram.ru',
+            username='bench-auth',
+            first_name='bench',
+            last_name='auth',
+        )
+        token = Token.objects.create(user=user)
+        request = APIRequestFactory().get(
+            '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token.key}'
+        )
+        results = {}
+        for backend in (TokenAuthentication(), CachedTokenAuthentication()):
+            backend.authenticate(request)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(options['requests']):
+                    backend.authenticate(request)
+                elapsed = time.perf_counter() - start
+            per_request = elapsed / options['requests'] * 1_000_000
+            results[type(backend).__name__] = per_request
+            self.stdout.write(
+                f'{type(backend).__name__}: {per_request:.1f}us/запрос, '
+                f'запросов к БД {len(queries)}'
+            )
+        saved = (results['TokenAuthentication']
+                 - results['CachedTokenAuthentication'])
+        self.stdout.write(f'Экономия: {saved:.1f}us на запрос')
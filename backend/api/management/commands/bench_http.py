@@ -0,0 +1,125 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.utils import percentile
+
+PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/tags/',
+    '/api/ingredients/?name=%D1%81%D0%B0',
+    '/api/users/subscriptions/',
+)
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер запущенных серверов по HTTP: запросы в '
+            'секунду и процентили задержки. Сравнивает, например, '
+            'gunicorn (WSGI) и uvicorn (ASGI).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True,
+            help='Сервер в виде имя=http://host:port, можно несколько.'
+        )
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Путь для замера; по умолчанию основные GET-эндпоинты.'
+        )
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Секунд на каждый путь.')
+        parser.add_argument('--token', help='Токен для заголовка.')
+        parser.add_argument('--output', default='bench_http.json')
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        paths = options['paths'] or [
+            path for path in PATHS
+            if options['token'] or 'subscriptions' not in path
+        ]
+        results = {}
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith('http://'):
+                raise CommandError(f'Неверный --target: {target}')
+            results[name] = {
+                path: self.measure(name, url, path, headers, options)
+                for path in paths
+            }
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'options': {
+                name: options[name] for name in ('concurrency', 'duration')
+            },
+            'targets': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'
+        ))
+
+    def measure(self, name, url, path, headers, options):
+        url = urlsplit(url)
+        path = url.path.rstrip('/') + path
+        deadline = time.perf_counter() + options['duration']
+
+        def worker():
+            """Запросы по одному соединению до истечения времени."""
+            timings, errors = [], 0
+            connection = HTTPConnection(url.hostname, url.port, timeout=30)
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.will_close:
+                        connection.close()
+                except OSError:
+                    connection.close()
+                    errors += 1
+                    continue
+                if response.status >= 400:
+                    errors += 1
+                    continue
+                timings.append((time.perf_counter() - start) * 1000)
+            connection.close()
+            return timings, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            futures = [
+                executor.submit(worker)
+                for _ in range(options['concurrency'])
+            ]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+        timings = [value for values, _ in results for value in values]
+        errors = sum(errors for _, errors in results)
+        if not timings:
+            raise CommandError(f'{name} {path}: нет успешных ответов')
+        result = {
+            'requests': len(timings),
+            'errors': errors,
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'max_ms': round(max(timings), 2),
+        }
+        self.stdout.write(
+            f'{name} {path}: {result["rps"]} rps '
+            f'p50={result["p50_ms"]}ms p99={result["p99_ms"]}ms '
+            f'ошибок={errors}'
+        )
+        return result
@@ -0,0 +1,79 @@
+import time
+from base64 import b64encode
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+from api.management.utils import rollback
+
+
+class Command(BaseCommand):
+    help = ('Сравнение времени страницы /api/recipes/ при выдаче '
+            'через OFFSET и через курсор на разной глубине. '
+            'Все созданные записи откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1_000_000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with rollback():
+            self.run(options)
+
+    def run(self, options):
+        author = User.objects.create(
+            email='bench-pages@foodgram.ru',
+            username='bench-pages',
+            first_name='bench',
+            last_name='pages',
+        )
+        total = options['recipes']
+        batch_size = options['batch_size']
+        for start in range(0, total, batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {i}',
+                    text='Описание',
+                    image='recipes/images/bench.png',
+                    cooking_time=10,
+                )
+                for i in range(start, min(total, start + batch_size))
+            )
+        ids = Recipe.objects.filter(author=author).order_by('-id')
+        client = APIClient()
+        limit = options['limit']
+        for depth in (0, total // 100, total // 10, total // 2, total - limit):
+            page = depth // limit + 1
+            offset_ms = self.measure(
+                client, f'/api/recipes/?limit={limit}&page={page}', options
+            )
+            if depth:
+                position = ids.values_list('id', flat=True)[depth - 1]
+                cursor = b64encode(
+                    urlencode({'p': position}).encode()
+                ).decode()
+            else:
+                cursor = ''
+            cursor_ms = self.measure(
+                client, f'/api/recipes/?limit={limit}&cursor={cursor}',
+                options
+            )
+            self.stdout.write(
+                f'depth={depth}: offset={offset_ms:.1f}ms '
+                f'cursor={cursor_ms:.1f}ms'
+            )
+
+    def measure(self, client, url, options):
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.content
+        return sorted(timings)[len(timings) // 2]
@@ -0,0 +1,155 @@
+import json
+import time
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from recipes.models import Recipe
+from users.models import User
+from api.compiled import RECIPE_FIELDS, CompiledRecipeSerializer
+from api.management.utils import percentile, rollback
+from api.relations import UserRelations
+from api.serializers import RecipeSerializer
+from api.views import get_recipes_queryset
+
+
+def regular(queryset, many, context):
+    if not many:
+        queryset = queryset.get()
+    data = RecipeSerializer(queryset, many=many, context=context).data
+    return JSONRenderer().render(data)
+
+
+def compiled(queryset, many, context):
+    queryset = queryset.values(*RECIPE_FIELDS)
+    if not many:
+        queryset = queryset.get()
+    data = CompiledRecipeSerializer(
+        queryset, many=many, context=context
+    ).data
+    return JSONRenderer().render(data)
+
+
+class Command(BaseCommand):
+    help = ('Замер сериализации рецептов: RecipeSerializer против '
+            'CompiledRecipeSerializer. Побайтное совпадение вывода '
+            'проверяют тесты api/tests.py. Данные создаются командой '
+            'generate_data и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Повторов каждого сценария.')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--existing', action='store_true',
+                            help='Не создавать данные, мерить на текущих.')
+        parser.add_argument('--output', default='bench_serializers.json')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with rollback():
+            if not options['existing']:
+                call_command(
+                    'generate_data',
+                    users=options['users'],
+                    recipes=options['recipes'],
+                    prefix='bench-serializers',
+                    seed=options['seed'],
+                    stdout=self.stdout,
+                )
+            results = self.run(options)
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'options': {
+                name: options[name]
+                for name in ('repeat', 'users', 'recipes', 'existing')
+            },
+            'scenarios': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'
+        ))
+
+    def scenarios(self):
+        """(имя, queryset, many, image_variant) для замера."""
+        recipes = Recipe.objects.all()
+        detail = list(recipes.values_list('pk', flat=True)[:5])
+        if not detail:
+            raise CommandError('Нет рецептов для замера.')
+        yield 'list-6', recipes[:6], True, 'medium'
+        yield 'list-50', recipes[:50], True, 'medium'
+        yield 'list-no-variant', recipes[:50], True, None
+        yield 'list-empty', recipes.none(), True, 'medium'
+        for pk in detail:
+            yield f'retrieve-{pk}', recipes.filter(pk=pk), False, None
+
+    def run(self, options):
+        # Часть рецептов с миниатюрами, чтобы замерить и эти ссылки;
+        # изменение откатывается вместе с остальными данными.
+        Recipe.objects.filter(
+            pk__in=Recipe.objects.values('pk')[:3]
+        ).update(has_thumbnails=True)
+        reader = User.objects.annotate(
+            follows=Count('follower')
+        ).order_by('-follows', 'id').first()
+        users = {'anonymous': AnonymousUser()}
+        if reader is not None:
+            users['reader'] = reader
+        factory = APIRequestFactory()
+        results = {}
+        for user_name, user in users.items():
+            request = Request(factory.get('/api/recipes/'))
+            request.user = user
+            relations = UserRelations.load(user)
+            for name, queryset, many, variant in self.scenarios():
+                context = {'request': request, 'relations': relations}
+                if variant:
+                    context['image_variant'] = variant
+                name = f'{user_name}:{name}'
+                results[name] = self.measure(
+                    name, queryset, many, context, options['repeat']
+                )
+        return results
+
+    def measure(self, name, queryset, many, context, repeat):
+        outputs, result = {}, {}
+        for label, render in (('regular', regular), ('compiled', compiled)):
+            timings = []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    outputs[label] = render(
+                        get_recipes_queryset(queryset)
+                        if label == 'regular' else queryset,
+                        many, context,
+                    )
+                    timings.append((time.perf_counter() - start) * 1000)
+            result[label] = {
+                'queries': len(queries),
+                'p50_ms': round(percentile(timings, 0.5), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+            }
+        result['bytes'] = len(outputs['compiled'])
+        result['speedup'] = round(
+            result['regular']['p50_ms']
+            / max(result['compiled']['p50_ms'], 0.001), 2
+        )
+        self.stdout.write(
+            f'{name}: {result["regular"]["p50_ms"]}ms -> '
+            f'{result["compiled"]["p50_ms"]}ms '
+            f'(x{result["speedup"]}), запросов '
+            f'{result["regular"]["queries"]} -> '
+            f'{result["compiled"]["queries"]}'
+        )
+        return result
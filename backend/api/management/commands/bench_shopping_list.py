@@ -0,0 +1,115 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Sum
+
+from recipes.models import (
+    Ingredient, IngredientsRecipe, Recipe, ShoppingCartRecipe,
+    ShoppingListItem
+)
+from users.models import User
+from api.management.utils import rollback
+from api.shopping_list import apply_delta, aggregate_shopping_list
+
+
+class Command(BaseCommand):
+    help = ('Сравнение агрегации списка покупок на лету и чтения '
+            'готового списка. Все созданные записи откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=2000,
+                            help='Рецептов в корзине.')
+        parser.add_argument('--ingredients', type=int, default=10,
+                            help='Ингредиентов в рецепте.')
+        parser.add_argument('--catalog', type=int, default=500,
+                            help='Размер справочника ингредиентов.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with rollback():
+            self.run(options)
+
+    def run(self, options):
+        user = User.objects.create(
+            email='bench-cart@foodgram.ru',
+            username='bench-cart',
+            first_name='bench',
+            last_name='cart',
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench-ingredient-{i}', measurement_unit='г')
+            for i in range(options['catalog'])
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='bench-ingredient-'
+        ).values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=user,
+                name=f'Рецепт {i}',
+                text='Описание',
+                image='recipes/images/bench.png',
+                cooking_time=10,
+            )
+            for i in range(options['recipes'])
+        )
+        recipes = list(Recipe.objects.filter(
+            author=user
+        ).values_list('id', flat=True))
+        IngredientsRecipe.objects.bulk_create(
+            (
+                IngredientsRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredients[
+                        (number + shift * 7) % len(ingredients)
+                    ],
+                    amount=shift + 1,
+                )
+                for number, recipe_id in enumerate(recipes)
+                for shift in range(options['ingredients'])
+            ),
+            batch_size=1000,
+        )
+        ShoppingCartRecipe.objects.bulk_create(
+            (ShoppingCartRecipe(user=user, recipe_id=recipe_id)
+             for recipe_id in recipes),
+            batch_size=1000,
+        )
+        expected = aggregate_shopping_list([user.id])
+        apply_delta([user.id], {
+            ingredient_id: amount
+            for (_, ingredient_id), amount in expected.items()
+        })
+
+        def aggregate():
+            return list(IngredientsRecipe.objects.filter(
+                recipe__cart_recipes__user=user
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(
+                ingredient_amount=Sum('amount')
+            ).order_by('ingredient__name'))
+
+        def materialized():
+            return list(ShoppingListItem.objects.filter(
+                user=user
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit',
+                ingredient_amount=F('total_amount'),
+            ).order_by('ingredient__name'))
+
+        if aggregate() != materialized():
+            self.stderr.write('Результаты двух способов различаются')
+        for name, function in (
+            ('aggregate', aggregate), ('materialized', materialized)
+        ):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                function()
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{name}: median={timings[len(timings) // 2]:.2f}ms '
+                f'max={timings[-1]:.2f}ms'
+            )
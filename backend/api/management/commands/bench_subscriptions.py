@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import Follow, User
+from api.management.utils import rollback
+
+
+class Command(BaseCommand):
+    help = ('Замер ленты подписок на синтетических данных. '
+            'Все созданные записи откатываются после замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=500)
+        parser.add_argument('--recipes', type=int, default=5,
+                            help='Рецептов у каждого автора.')
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Размер страницы ленты.')
+        parser.add_argument('--recipes-limit', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with rollback():
+            self.run(options)
+
+    def run(self, options):
+        reader = User.objects.create(
+            email='bench-reader@foodgram.ru',
+            username='bench-reader',
+            first_name='bench',
+            last_name='reader',
+        )
+        authors = User.objects.bulk_create(
+            User(
+                email=f'bench-author-{i}@foodgram.ru',
+                username=f'bench-author-{i}',
+                first_name='bench',
+                last_name=f'author-{i}',
+            )
+            for i in range(options['authors'])
+        )
+        if not authors[0].pk:
+            authors = list(User.objects.filter(
+                username__startswith='bench-author-'
+            ))
+        Follow.objects.bulk_create(
+            Follow(user=reader, following=author) for author in authors
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f'Рецепт {i}',
+                text='Описание',
+                image='recipes/images/bench.png',
+                cooking_time=10,
+            )
+            for author in authors
+            for i in range(options['recipes'])
+        )
+        client = APIClient()
+        client.force_authenticate(reader)
+        url = (f'/api/users/subscriptions/?limit={options["limit"]}'
+               f'&recipes_limit={options["recipes_limit"]}')
+        pages = (options['authors'] + options['limit'] - 1) // options['limit']
+        for page in range(1, pages + 1):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(f'{url}&page={page}')
+                elapsed = (time.perf_counter() - start) * 1000
+            self.stdout.write(
+                f'page={page} status={response.status_code} '
+                f'queries={len(queries)} time={elapsed:.1f}ms'
+            )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import FeedItem
+from users.models import User
+from api.feed import backfill
+
+
+class Command(BaseCommand):
+    help = ('Пересобрать ленты подписок пользователей по их подпискам, '
+            'например после массовой загрузки данных.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; можно указать несколько раз.'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(follower__isnull=False).distinct()
+        items = FeedItem.objects.all()
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+            items = items.filter(user__in=options['users'])
+        with transaction.atomic():
+            items.delete()
+            user_ids = list(users.order_by('pk').values_list('pk', flat=True))
+            for user_id in user_ids:
+                backfill(user_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {len(user_ids)}'
+        ))
@@ -0,0 +1,252 @@
+import random
+from collections import Counter, defaultdict
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.filters import TAG_IDS_CACHE_KEY
+from recipes.models import (
+    FavoriteRecipe, Ingredient, IngredientsRecipe,
+    Recipe, ShoppingCartRecipe, ShoppingListItem, Tag
+    )
+from recipes.search import update_recipe_index
+from users.models import Follow, User
+from api import feed
+from api.cache import invalidate
+from api.utils import COUNTERS
+
+
+def zipf_weights(size, skew):
+    """Накопленные веса, при которых первые объекты самые популярные."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(size)))
+
+
+def pick(population, cum_weights, count):
+    """Выбрать до count разных объектов с учетом весов."""
+    count = min(count, len(population))
+    chosen = set()
+    for item in random.choices(
+            population, cum_weights=cum_weights, k=count * 3):
+        if len(chosen) == count:
+            break
+        chosen.add(item)
+    return chosen
+
+
+class Command(BaseCommand):
+    help = ('Создать синтетических пользователей, рецепты, подписки, '
+            'избранное и корзины с неравномерным распределением '
+            'популярности. Все записи вставляются пакетами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Ингредиентов в каждом рецепте.')
+        parser.add_argument('--tags', type=int, default=2,
+                            help='Тегов у каждого рецепта.')
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя.')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Среднее число рецептов в избранном.')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа.')
+        parser.add_argument('--prefix', default='gen',
+                            help='Префикс имен создаваемых пользователей.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                f'укажите другой --prefix.'
+            )
+        with transaction.atomic():
+            ingredient_ids, tag_ids = self.catalog()
+            user_ids = self.users(prefix, options['users'])
+            recipe_ids = self.recipes(
+                user_ids, ingredient_ids, tag_ids, options
+            )
+            self.relations(user_ids, recipe_ids, options)
+            update_recipe_index(Recipe.objects.filter(author__in=user_ids))
+        for name in ('tags', 'ingredients', 'recipes', 'users'):
+            invalidate(name)
+        cache.delete(TAG_IDS_CACHE_KEY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}'
+        ))
+
+    def catalog(self):
+        """Ингредиенты и теги; если каталог пуст, он создается."""
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+                for i in range(1000)
+            )
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in (
+                    ('Завтрак', '#33ff66', 'breakfast'),
+                    ('Обед', '#456344', 'lunch'),
+                    ('Ужин', '#553380', 'dinner'),
+                )
+            )
+        return (
+            list(Ingredient.objects.values_list('id', flat=True)),
+            list(Tag.objects.values_list('id', flat=True)),
+        )
+
+    def users(self, prefix, total):
+        password = make_password('generated-password')
+        User.objects.bulk_create(
+            (
+                User(
+                    email=f'{prefix}-{i}@foodgram.ru',
+                    username=f'{prefix}-{i}',
+                    first_name='Имя',
+                    last_name='Фамилия',
+                    password=password,
+                )
+                for i in range(total)
+            ),
+            batch_size=self.batch_size,
+        )
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}-'
+        ).order_by('id').values_list('id', flat=True))
+
+    def recipes(self, user_ids, ingredient_ids, tag_ids, options):
+        """Рецепты у популярных авторов встречаются чаще."""
+        authors = random.choices(
+            user_ids,
+            cum_weights=zipf_weights(len(user_ids), options['skew']),
+            k=options['recipes'],
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author_id,
+                    name=f'Рецепт {i}',
+                    text='Описание рецепта',
+                    image='recipes/images/generated.png',
+                    cooking_time=random.randint(5, 120),
+                )
+                for i, author_id in enumerate(authors)
+            ),
+            batch_size=self.batch_size,
+        )
+        recipe_ids = list(Recipe.objects.filter(
+            author__in=user_ids
+        ).order_by('id').values_list('id', flat=True))
+        count = min(options['ingredients'], len(ingredient_ids))
+        self.amounts = defaultdict(list)
+        for recipe_id in recipe_ids:
+            for ingredient_id in random.sample(ingredient_ids, count):
+                self.amounts[recipe_id].append(
+                    (ingredient_id, random.randint(1, 500))
+                )
+        self.bulk_insert(
+            IngredientsRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for recipe_id, amounts in self.amounts.items()
+            for ingredient_id, amount in amounts
+        )
+        count = min(options['tags'], len(tag_ids))
+        self.bulk_insert(
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in random.sample(tag_ids, count)
+        )
+        return recipe_ids
+
+    def relations(self, user_ids, recipe_ids, options):
+        """Подписки, избранное и корзины тяготеют к популярным объектам.
+
+        Счетчики и списки покупок считаются здесь же по созданным
+        строкам, без пересчета по всей базе; ленты подписок
+        собираются после вставки подписок.
+        """
+        skew = options['skew']
+        author_weights = zipf_weights(len(user_ids), skew)
+        recipe_weights = zipf_weights(len(recipe_ids), skew)
+        follows = [
+            (user_id, author_id)
+            for user_id in user_ids
+            for author_id in pick(
+                user_ids, author_weights,
+                random.randint(0, 2 * options['follows'])
+            )
+            if author_id != user_id
+        ]
+        self.bulk_insert(
+            Follow(user_id=user_id, following_id=author_id)
+            for user_id, author_id in follows
+        )
+        followers = Counter(author_id for _, author_id in follows)
+        User.objects.bulk_update(
+            [User(pk=pk, followers_count=total)
+             for pk, total in followers.items()],
+            ['followers_count'],
+            batch_size=1000,
+        )
+        for user_id in {user_id for user_id, _ in follows}:
+            feed.backfill(user_id)
+        counters = defaultdict(Counter)
+        totals = Counter()
+        for model, average in ((FavoriteRecipe, options['favorites']),
+                               (ShoppingCartRecipe, options['cart'])):
+            rows = [
+                (user_id, recipe_id)
+                for user_id in user_ids
+                for recipe_id in pick(
+                    recipe_ids, recipe_weights,
+                    random.randint(0, 2 * average)
+                )
+            ]
+            self.bulk_insert(
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id, recipe_id in rows
+            )
+            counter = COUNTERS[model]
+            for user_id, recipe_id in rows:
+                counters[recipe_id][counter] += 1
+                if model is ShoppingCartRecipe:
+                    for ingredient_id, amount in self.amounts[recipe_id]:
+                        totals[user_id, ingredient_id] += amount
+        Recipe.objects.bulk_update(
+            [Recipe(pk=pk, **values) for pk, values in counters.items()],
+            list(COUNTERS.values()),
+            batch_size=1000,
+        )
+        self.bulk_insert(
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=amount,
+            )
+            for (user_id, ingredient_id), amount in totals.items()
+        )
+
+    def bulk_insert(self, objects):
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                type(obj).objects.bulk_create(batch)
+                batch = []
+        if batch:
+            type(batch[0]).objects.bulk_create(batch)
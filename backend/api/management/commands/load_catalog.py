@@ -0,0 +1,268 @@
+import csv
+import json
+import os
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from recipes.filters import TAG_IDS_CACHE_KEY
+from recipes.models import Ingredient, Tag
+from api.cache import invalidate
+from api.response_cache import invalidate_tags, slug_tag
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 2000
+PROGRESS_EVERY = 20000
+
+
+class DryRun(Exception):
+    """Откатить загрузку в режиме --dry-run."""
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """Читать объекты из JSON-массива верхнего уровня по частям.
+
+    Файл не загружается в память целиком: очередной объект разбирается
+    json.JSONDecoder.raw_decode(), как только он полностью прочитан.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise CommandError('Ожидался JSON-массив объектов.')
+            started = True
+            position += 1
+            continue
+        if started and position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            try:
+                obj, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CommandError('Файл JSON оборван или поврежден.')
+            else:
+                if not isinstance(obj, dict):
+                    raise CommandError(
+                        'Элементы массива должны быть объектами.'
+                    )
+                position = end
+                yield obj
+                continue
+        if eof:
+            raise CommandError('Файл JSON оборван или поврежден.')
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+class IngredientLoader:
+    """Добавляет ингредиенты, которых еще нет (по unique ingredient)."""
+    model = Ingredient
+    fields = ('name', 'measurement_unit')
+
+    def __init__(self, command):
+        self.command = command
+        self.batch = {}
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def add(self, record):
+        key = (record['name'].strip(), record['measurement_unit'].strip())
+        self.batch[key] = record
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        names = {name for name, _ in self.batch}
+        existing = set(Ingredient.objects.filter(
+            name__in=names
+        ).values_list('name', 'measurement_unit'))
+        new = [key for key in self.batch if key not in existing]
+        self.unchanged += len(self.batch) - len(new)
+        self.created += len(new)
+        for name, unit in new:
+            self.command.diff(f'+ ингредиент {name} ({unit})')
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in new),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        self.batch = {}
+
+
+class TagLoader:
+    """Создает теги и обновляет название и цвет существующих по slug.
+
+    bulk_update() не вызывает сигналы, поэтому slug новых и измененных
+    тегов собираются для сброса закешированных ответов.
+    """
+    model = Tag
+    fields = ('name', 'color', 'slug')
+
+    def __init__(self, command):
+        self.command = command
+        self.batch = {}
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.slugs = set()
+
+    def add(self, record):
+        self.batch[record['slug'].strip()] = record
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        existing = Tag.objects.in_bulk(list(self.batch), field_name='slug')
+        new, changed = [], []
+        for slug, record in self.batch.items():
+            name, color = record['name'].strip(), record['color'].strip()
+            tag = existing.get(slug)
+            if tag is None:
+                new.append(Tag(name=name, color=color, slug=slug))
+                self.command.diff(f'+ тег {slug}: {name} {color}')
+            elif (tag.name, tag.color) != (name, color):
+                self.command.diff(
+                    f'~ тег {slug}: {tag.name} {tag.color} -> {name} {color}'
+                )
+                tag.name, tag.color = name, color
+                changed.append(tag)
+            else:
+                self.unchanged += 1
+        self.created += len(new)
+        self.updated += len(changed)
+        self.slugs.update(tag.slug for tag in (*new, *changed))
+        Tag.objects.bulk_update(changed, ('name', 'color'))
+        Tag.objects.bulk_create(new)
+        self.batch = {}
+
+
+LOADERS = {
+    'recipes.ingredient': IngredientLoader,
+    'recipes.tag': TagLoader,
+}
+FILE_MODELS = {
+    'ingredients': 'recipes.ingredient',
+    'tags': 'recipes.tag',
+}
+
+
+class Command(BaseCommand):
+    help = ('Загрузить ингредиенты и теги из JSON или CSV пакетами. '
+            'Существующие ингредиенты пропускаются, теги обновляются '
+            'по slug; остальные модели фикстуры игнорируются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы .json или .csv.')
+        parser.add_argument(
+            '--model', choices=sorted(LOADERS),
+            help='Модель для CSV и записей без ключа model; по умолчанию '
+                 'определяется по имени файла.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать изменения, ничего не записывая.'
+        )
+        parser.add_argument(
+            '--diff', action='store_true',
+            help='Показать каждую новую или измененную запись.'
+        )
+
+    def handle(self, *args, **options):
+        self.show_diff = options['diff']
+        self.loaders = {}
+        self.read = 0
+        self.skipped = 0
+        try:
+            with transaction.atomic():
+                for path in options['paths']:
+                    self.load_file(path, options['model'])
+                for loader in self.loaders.values():
+                    loader.flush()
+                if options['dry_run']:
+                    raise DryRun
+        except DryRun:
+            pass
+        except IntegrityError as error:
+            raise CommandError(f'Загрузка отменена: {error}')
+        except (KeyError, AttributeError) as error:
+            raise CommandError(f'В записи нет поля {error}')
+        self.report(options['dry_run'])
+        if not options['dry_run']:
+            self.invalidate()
+
+    def invalidate(self):
+        """Сбросить кеши каталога во всех процессах через общий кеш."""
+        invalidate('tags')
+        invalidate('ingredients')
+        cache.delete(TAG_IDS_CACHE_KEY)
+        tags = self.loaders.get('recipes.tag')
+        if tags is not None:
+            invalidate_tags(slug_tag(slug) for slug in tags.slugs)
+
+    def load_file(self, path, model):
+        stem, extension = os.path.splitext(os.path.basename(path))
+        default = model or FILE_MODELS.get(stem)
+        with open(path, encoding='utf-8', newline='') as file:
+            if extension == '.csv':
+                self.load_rows(self.iter_csv(file, default), default)
+            elif extension == '.json':
+                self.load_rows(iter_json_array(file), default)
+            else:
+                raise CommandError(f'Неизвестный формат файла: {path}')
+
+    def iter_csv(self, file, model):
+        if model is None:
+            raise CommandError('Для CSV укажите --model.')
+        fields = LOADERS[model].fields
+        for row in csv.reader(file):
+            if not row or tuple(row) == fields:
+                continue
+            yield dict(zip(fields, row))
+
+    def load_rows(self, records, default):
+        for record in records:
+            self.read += 1
+            model = record.get('model', default)
+            if model not in LOADERS:
+                self.skipped += 1
+                continue
+            if model not in self.loaders:
+                self.loaders[model] = LOADERS[model](self)
+            self.loaders[model].add(record.get('fields', record))
+            if self.read % PROGRESS_EVERY == 0:
+                self.stdout.write(f'Прочитано записей: {self.read}')
+
+    def diff(self, line):
+        if self.show_diff:
+            self.stdout.write(line)
+
+    def report(self, dry_run):
+        self.stdout.write(
+            f'Прочитано записей: {self.read}, пропущено: {self.skipped}'
+        )
+        for loader in self.loaders.values():
+            self.stdout.write(
+                f'{loader.model._meta.verbose_name_plural}: '
+                f'новых {loader.created}, измененных {loader.updated}, '
+                f'без изменений {loader.unchanged}'
+            )
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Изменения не записаны'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Каталог загружен'))
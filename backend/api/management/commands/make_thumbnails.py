@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from api.images import process
+
+
+class Command(BaseCommand):
+    help = 'Построить миниатюры для рецептов, у которых их еще нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить миниатюры у всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(has_thumbnails=False)
+        names = recipes.values_list('image', flat=True).distinct()
+        for number, name in enumerate(names.iterator(), start=1):
+            process(name)
+            self.stdout.write(f'{number}: {name}')
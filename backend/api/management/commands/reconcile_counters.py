@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCartRecipe
+from users.models import Follow, User
+
+
+def count_subquery(model, field='recipe'):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = ('Сверить счетчики избранного и корзин у рецептов и '
+            'счетчики подписчиков у пользователей с таблицами '
+            'и исправить расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения.'
+        )
+
+    def handle(self, *args, **options):
+        actual = {
+            'favorites_count': count_subquery(FavoriteRecipe),
+            'cart_count': count_subquery(ShoppingCartRecipe),
+        }
+        broken = Recipe.objects.annotate(
+            actual_favorites=actual['favorites_count'],
+            actual_cart=actual['cart_count'],
+        ).filter(
+            ~Q(favorites_count=F('actual_favorites'))
+            | ~Q(cart_count=F('actual_cart'))
+        ).values_list('pk', flat=True)
+        broken = list(broken)
+        self.stdout.write(f'Рецептов с расхождениями: {len(broken)}')
+        if broken and not options['dry_run']:
+            Recipe.objects.filter(pk__in=broken).update(**actual)
+            self.stdout.write(self.style.SUCCESS('Счетчики исправлены'))
+        followers = count_subquery(Follow, 'following')
+        broken = list(User.objects.annotate(
+            actual_followers=followers,
+        ).exclude(
+            followers_count=F('actual_followers')
+        ).values_list('pk', flat=True))
+        self.stdout.write(f'Пользователей с расхождениями: {len(broken)}')
+        if broken and not options['dry_run']:
+            User.objects.filter(pk__in=broken).update(
+                followers_count=followers
+            )
+            self.stdout.write(self.style.SUCCESS(
+                'Счетчики подписчиков исправлены'
+            ))
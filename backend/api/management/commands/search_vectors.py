@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+
+from recipes.models import Recipe
+from recipes.search import update_recipe_index
+
+
+class Command(BaseCommand):
+    help = ('Заполнить поисковые векторы и массивы id ингредиентов '
+            'рецептов пакетами по id. По умолчанию только у рецептов, '
+            'где они еще не заполнены.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать у всех рецептов.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Поисковые поля рецептов есть только '
+                               'на PostgreSQL.')
+        recipes = Recipe.objects.order_by('pk')
+        if not options['all']:
+            recipes = recipes.filter(
+                Q(search_vector__isnull=True) | Q(ingredient_ids=[])
+            )
+        batch_size = options['batch_size']
+        last_pk = 0
+        total = 0
+        while True:
+            ids = list(recipes.filter(
+                pk__gt=last_pk
+            ).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            total += update_recipe_index(
+                Recipe.objects.filter(pk__in=ids)
+            )
+            last_pk = ids[-1]
+            self.stdout.write(f'Обновлено рецептов: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, обновлено рецептов: {total}'
+        ))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+from api.shopping_list import aggregate_shopping_list
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать списки покупок по корзинам пользователей '
+            'или проверить их (--verify).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сравнить сохраненные суммы с пересчитанными.'
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; можно указать несколько раз.'
+        )
+
+    def handle(self, *args, **options):
+        expected = aggregate_shopping_list(options['users'])
+        items = ShoppingListItem.objects.all()
+        if options['users']:
+            items = items.filter(user__in=options['users'])
+        if options['verify']:
+            self.verify(expected, items)
+            return
+        with transaction.atomic():
+            items.delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                ),
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано строк списка покупок: {len(expected)}'
+        ))
+
+    def verify(self, expected, items):
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in items.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            ).iterator()
+        }
+        mismatches = [
+            (key, stored.get(key), expected.get(key))
+            for key in stored.keys() | expected.keys()
+            if stored.get(key) != expected.get(key)
+        ]
+        for (user_id, ingredient_id), actual, amount in sorted(mismatches):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id} '
+                f'сохранено={actual} ожидается={amount}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Списки покупок совпадают'))
@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rollback():
+    """Выполняет блок в транзакции и откатывает все её изменения."""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def percentile(values, share):
+    """Процентиль по ближайшему рангу."""
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(share * len(values)) - 1))
+    return values[index]
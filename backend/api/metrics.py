@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS = (
+    ('requests', 'counter', 'Обработано запросов.'),
+    ('db_queries', 'counter', 'Выполнено SQL-запросов.'),
+    ('db_seconds', 'counter', 'Время SQL-запросов, с.'),
+    ('db_duplicate_queries', 'counter', 'Повторы одного и того же SQL.'),
+    ('render_seconds', 'counter', 'Время рендеринга ответа, с.'),
+    ('query_budget_exceeded', 'counter', 'Превышений бюджета запросов.'),
+    ('db_queries_max', 'gauge', 'Наибольшее число SQL за один запрос.'),
+)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Действие выполнило больше SQL-запросов, чем указано в бюджете."""
+
+
+class QueryRecorder:
+    """Обертка для connection.execute_wrapper(), считающая SQL-запросы.
+
+    Одинаковый текст SQL (параметры передаются отдельно) считается
+    одной сигнатурой: повторы сигнатуры указывают на N+1.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.render_seconds = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.signatures[sql] += 1
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.signatures)
+
+    def repeated(self, threshold):
+        return [
+            (sql, count) for sql, count in self.signatures.items()
+            if count >= threshold
+        ]
+
+
+current_recorder = ContextVar('query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обертка execute_wrapper(), передающая SQL recorder'у запроса.
+
+    Recorder берется из контекста, а не из соединения: под ASGI
+    синхронные части разных запросов делят поток и соединение с БД,
+    а sync_to_async переносит контекст запроса в этот поток.
+    """
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install)
+
+
+@contextmanager
+def recording(recorder):
+    """Учитывать в recorder SQL-запросы текущего контекста."""
+    for connection in connections.all():
+        install(connection)
+    token = current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        current_recorder.reset(token)
+
+
+class MetricsRegistry:
+    """Накопленные метрики по действиям в памяти процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(Counter)
+
+    def record(self, action, recorder, over_budget):
+        with self.lock:
+            values = self.values[action]
+            values['requests'] += 1
+            values['db_queries'] += recorder.count
+            values['db_seconds'] += recorder.seconds
+            values['db_duplicate_queries'] += recorder.duplicates
+            values['render_seconds'] += recorder.render_seconds
+            values['query_budget_exceeded'] += over_budget
+            values['db_queries_max'] = max(
+                values['db_queries_max'], recorder.count
+            )
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self.lock:
+            values = {
+                action: dict(counter)
+                for action, counter in sorted(self.values.items())
+            }
+        lines = []
+        for key, kind, description in METRICS:
+            name = f'foodgram_{key}'
+            if kind == 'counter':
+                name += '_total'
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for action, counter in values.items():
+                lines.append(
+                    f'{name}{{action="{action}"}} {counter.get(key, 0)}'
+                )
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+
+registry = MetricsRegistry()
+
+
+def action_name(request, view_func):
+    """Имя действия: basename-action для вьюсетов, иначе имя url."""
+    actions = getattr(view_func, 'actions', None)
+    basename = getattr(view_func, 'initkwargs', {}).get('basename')
+    if actions and basename:
+        method = request.method.lower()
+        return f'{basename}-{actions.get(method, method)}'
+    match = request.resolver_match
+    if match is not None and match.url_name:
+        return match.url_name
+    return view_func.__name__
+
+
+class QueryMetricsMiddleware:
+    """Число и время SQL-запросов, повторы и время рендеринга.
+
+    Значения копятся в registry по действиям, при QUERY_METRICS_HEADERS
+    отдаются в заголовках X-Query-*, а превышение QUERY_BUDGETS пишется
+    в лог или, при QUERY_BUDGET_RAISE, приводит к QueryBudgetExceeded.
+    Под ASGI работает как корутина и не переносит цепочку в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Так же, как MiddlewareMixin: обработчик увидит корутину.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+            self.process_template_response = self.async_measure_render
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        request.query_recorder = recorder
+        with recording(recorder):
+            response = self.get_response(request)
+        return self.process(request, response, recorder)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        request.query_recorder = recorder
+        with recording(recorder):
+            response = await self.get_response(request)
+        return self.process(request, response, recorder)
+
+    def process(self, request, response, recorder):
+        """Записать метрики действия и добавить заголовки X-Query-*."""
+        match = request.resolver_match
+        if match is None:
+            return response
+        action = action_name(request, match.func)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, recorder, action
+            )
+            return response
+        self.finish(recorder, action)
+        if settings.QUERY_METRICS_HEADERS:
+            response['X-Query-Count'] = recorder.count
+            response['X-Query-Time'] = f'{recorder.seconds * 1000:.2f}'
+            response['X-Query-Duplicates'] = recorder.duplicates
+            response['X-Render-Time'] = (
+                f'{recorder.render_seconds * 1000:.2f}'
+            )
+        return response
+
+    def measure_render(self, request, response):
+        """Засечь время рендеринга ответа DRF."""
+        recorder = request.query_recorder
+        start = time.perf_counter()
+
+        def rendered(response):
+            recorder.render_seconds += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    process_template_response = measure_render
+
+    async def async_measure_render(self, request, response):
+        return self.measure_render(request, response)
+
+    def stream(self, content, recorder, action):
+        """Учесть запросы, которые выполняются при отдаче потока."""
+        with recording(recorder):
+            yield from content
+        self.finish(recorder, action)
+
+    def finish(self, recorder, action):
+        for sql, count in recorder.repeated(settings.QUERY_REPEAT_THRESHOLD):
+            logger.warning(
+                'Возможный N+1 в %s: %d одинаковых запросов: %s',
+                action, count, sql[:200]
+            )
+        budget = settings.QUERY_BUDGETS.get(action)
+        over_budget = budget is not None and recorder.count > budget
+        registry.record(action, recorder, over_budget)
+        if not over_budget:
+            return
+        message = (f'{action}: {recorder.count} SQL-запросов '
+                   f'при бюджете {budget}')
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class MetricsView(APIView):
+    """Метрики процесса в формате Prometheus для администраторов."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
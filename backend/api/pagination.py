@@ -1,6 +1,163 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from functools import partial
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from .cache import get_version
+
+COUNT_KEY = 'count:{versions}:{signature}'
+
+
+def estimate_count(queryset):
+    """ Оценка числа строк таблицы по статистике PostgreSQL.
+
+    Возвращает None для запросов с условиями, других СУБД и небольших
+    таблиц, где точный COUNT(*) и так дешев.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < settings.COUNT_ESTIMATE_THRESHOLD:
+        return None
+    return row[0]
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берет количество из кеша или из оценки.
+
+    Для приблизительного количества страницы за его пределами не
+    считаются ошибкой, а срез не обрезается по count. Номера меньше 1
+    по-прежнему дают EmptyPage.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        cached = None
+        if self.count_key is not None:
+            cached = cache.get(self.count_key)
+        if cached is not None:
+            count, self.count_exact = cached
+            return count
+        count = estimate_count(self.object_list)
+        self.count_exact = count is None
+        if count is None:
+            count = self.object_list.count()
+        if self.count_key is not None:
+            cache.set(
+                self.count_key,
+                (count, self.count_exact),
+                settings.COUNT_CACHE_TIMEOUT,
+            )
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            number = int(number)
+            if self.count_exact or number < 1:
+                raise
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+
+class IdCursorPagination(CursorPagination):
+    """Постраничный вывод по курсору на id, без подсчета количества."""
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-id'
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    """Постраничный вывод с параметром limit.
+
+    Если в запросе есть параметр cursor (для первой страницы — пустой),
+    выдача переключается на IdCursorPagination: без COUNT(*) и OFFSET,
+    с непрозрачными ссылками next/previous. Порядок задается атрибутом
+    cursor_ordering вьюсета.
+
+    Количество объектов кешируется по набору фильтров запроса на
+    COUNT_CACHE_TIMEOUT секунд. Кеш сбрасывается через версии, которые
+    перечисляет метод get_count_scopes() вьюсета. В ответе поле
+    count_exact сообщает, точное ли количество.
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_paginator = None
+    django_paginator_class = CachedCountPaginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if IdCursorPagination.cursor_query_param in request.query_params:
+            self.cursor_paginator = IdCursorPagination()
+            self.cursor_paginator.ordering = getattr(
+                view, 'cursor_ordering', IdCursorPagination.ordering
+            )
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.django_paginator_class = partial(
+            CachedCountPaginator, count_key=self.get_count_key(request, view)
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_key(self, request, view):
+        """ Ключ кеша количества: версии областей и параметры фильтров."""
+        get_count_scopes = getattr(view, 'get_count_scopes', None)
+        if get_count_scopes is None:
+            return None
+        versions = ':'.join(
+            f'{name}={get_version(name)}' for name in get_count_scopes()
+        )
+        skip = {
+            self.page_query_param,
+            self.page_size_query_param,
+            IdCursorPagination.cursor_query_param,
+        }
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            if name not in skip
+            for value in values
+        )
+        signature = hashlib.md5(
+            f'{request.path}?{urlencode(params)}'.encode()
+        ).hexdigest()
+        return COUNT_KEY.format(versions=versions, signature=signature)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        paginator = self.page.paginator
+        return Response({
+            'count': paginator.count,
+            'count_exact': paginator.count_exact,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
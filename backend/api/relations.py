@@ -0,0 +1,77 @@
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import FavoriteRecipe, ShoppingCartRecipe
+from users.models import Follow
+from .cache import invalidate
+
+RELATIONS_KEY = 'relations:{user_id}'
+RELATIONS_SCOPE = 'relations:{user_id}'
+REQUEST_ATTR = '_user_relations'
+
+
+class UserRelations:
+    """ Id избранного, корзины и подписок пользователя.
+
+    Загружаются один раз за запрос тремя запросами к БД либо из общего
+    кеша, где хранятся компактными массивами чисел.
+    """
+
+    def __init__(self, favorites=(), cart=(), following=()):
+        self.favorites = frozenset(favorites)
+        self.cart = frozenset(cart)
+        self.following = frozenset(following)
+
+    @classmethod
+    def load(cls, user):
+        if user.is_anonymous:
+            return cls()
+        key = RELATIONS_KEY.format(user_id=user.pk)
+        cached = cache.get(key)
+        if cached is not None:
+            return cls(*(array('q', ids) for ids in cached))
+        ids = (
+            FavoriteRecipe.objects.filter(
+                user=user).values_list('recipe_id', flat=True),
+            ShoppingCartRecipe.objects.filter(
+                user=user).values_list('recipe_id', flat=True),
+            Follow.objects.filter(
+                user=user).values_list('following_id', flat=True),
+        )
+        ids = [array('q', sorted(values)) for values in ids]
+        cache.set(
+            key,
+            [values.tobytes() for values in ids],
+            settings.RELATIONS_CACHE_TIMEOUT,
+        )
+        return cls(*ids)
+
+
+def get_relations(context):
+    """ Связи текущего пользователя из контекста сериалайзера.
+
+    Если вьюха не передала их в контекст, они загружаются и
+    запоминаются на объекте запроса.
+    """
+    relations = context.get('relations')
+    if relations is not None:
+        return relations
+    request = context['request']
+    relations = getattr(request, REQUEST_ATTR, None)
+    if relations is None:
+        relations = UserRelations.load(request.user)
+        setattr(request, REQUEST_ATTR, relations)
+    return relations
+
+
+def relations_scope(user):
+    """ Область кеша количеств, зависящих от связей пользователя."""
+    return RELATIONS_SCOPE.format(user_id=user.pk)
+
+
+def invalidate_relations(user):
+    """ Сбросить связи пользователя после изменения подписок и списков."""
+    cache.delete(RELATIONS_KEY.format(user_id=user.pk))
+    invalidate(relations_scope(user))
@@ -0,0 +1,193 @@
+import gzip
+import hashlib
+import time
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+ENTRY_KEY = 'response:{signature}'
+LOCK_KEY = 'response:{signature}:lock'
+TAG_KEY = 'response-tag:{tag}'
+LOCK_TIMEOUT = 30
+
+
+def recipe_tag(pk):
+    return f'recipe:{pk}'
+
+
+def author_tag(pk):
+    return f'author:{pk}'
+
+
+def slug_tag(slug):
+    return f'tag:{slug}'
+
+
+def signature(request):
+    """Хеш схемы, хоста, пути и отсортированных параметров запроса.
+
+    В ответах абсолютные ссылки на картинки, поэтому ответ для одного
+    заголовка Host не должен отдаваться запросам с другим.
+    """
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    )
+    raw = (f'{request.scheme}://{request.get_host()}{request.path}'
+           f'?{urlencode(params)}')
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def tag_tokens(tags):
+    """Текущие метки тегов; отсутствующие создаются."""
+    keys = {TAG_KEY.format(tag=tag): tag for tag in tags}
+    tokens = {
+        keys[key]: token for key, token in cache.get_many(keys).items()
+    }
+    for key, tag in keys.items():
+        if tag not in tokens:
+            token = uuid.uuid4().hex
+            cache.add(key, token, timeout=None)
+            tokens[tag] = cache.get(key, token)
+    return tokens
+
+
+def invalidate_tags(tags):
+    """Сбросить ответы с любым из тегов после коммита транзакции."""
+    tags = set(tags)
+    if not tags:
+        return
+    transaction.on_commit(lambda: cache.set_many(
+        {TAG_KEY.format(tag=tag): uuid.uuid4().hex for tag in tags},
+        timeout=None,
+    ))
+
+
+def invalidate_recipes(recipe_ids):
+    invalidate_tags(recipe_tag(pk) for pk in recipe_ids)
+
+
+def response_tags(request, data):
+    """Теги ответа: рецепты, их авторы и теги, а также фильтры запроса.
+
+    Тег recipes есть у всех списков: создание и удаление рецептов
+    меняет состав любой страницы.
+    """
+    if 'results' in data:
+        tags = {'recipes'}
+        tags.update(
+            slug_tag(slug) for slug in request.query_params.getlist('tags')
+        )
+        if 'search' in request.query_params:
+            tags.add('search')
+        recipes = data['results']
+    else:
+        tags = set()
+        recipes = [data]
+    for recipe in recipes:
+        tags.add(recipe_tag(recipe['id']))
+        tags.add(author_tag(recipe['author']['id']))
+        tags.update(slug_tag(tag['slug']) for tag in recipe['tags'])
+    return tags
+
+
+def cached_content(request, entry):
+    """Ответ из сжатого JSON с учетом ETag и Accept-Encoding."""
+    created, tokens, etag, content = entry
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(content, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(
+            gzip.decompress(content), content_type='application/json'
+        )
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def lookup(request):
+    """Сохраненный ответ для анонимного запроса и взята ли блокировка.
+
+    Ответ свежий, пока не истек RESPONSE_CACHE_TIMEOUT и не сброшен ни
+    один его тег. Устаревший ответ еще RESPONSE_CACHE_STALE секунд
+    отдается всем, кроме одного запроса, который берет блокировку и
+    пересчитывает его. Снимать блокировку через release() должен только
+    этот запрос.
+    """
+    key = signature(request)
+    entry = cache.get(ENTRY_KEY.format(signature=key))
+    if entry is None:
+        return None, False
+    created, tokens = entry[:2]
+    fresh = (
+        time.time() - created < settings.RESPONSE_CACHE_TIMEOUT
+        and tag_tokens(tokens) == tokens
+    )
+    if fresh or not cache.add(
+            LOCK_KEY.format(signature=key), 1, LOCK_TIMEOUT):
+        return cached_content(request, entry), False
+    return None, True
+
+
+def release(request):
+    cache.delete(LOCK_KEY.format(signature=signature(request)))
+
+
+def store(request, response):
+    """Сохранить успешный ответ сжатым вместе с метками его тегов.
+
+    Метки читаются после построения ответа, поэтому изменение, попавшее
+    между ними, проживет в кеше не дольше RESPONSE_CACHE_TIMEOUT.
+    """
+    if response.status_code != 200:
+        return response
+    key = signature(request)
+    content = JSONRenderer().render(response.data)
+    entry = (
+        time.time(),
+        tag_tokens(response_tags(request, response.data)),
+        f'"{hashlib.md5(content).hexdigest()}"',
+        gzip.compress(content, compresslevel=6),
+    )
+    cache.set(
+        ENTRY_KEY.format(signature=key),
+        entry,
+        settings.RESPONSE_CACHE_TIMEOUT + settings.RESPONSE_CACHE_STALE,
+    )
+    return cached_content(request, entry)
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширует готовые ответы list и retrieve для анонимных посетителей.
+
+    Сброс идет по тегам из сигналов, а не очисткой всего кеша.
+    """
+
+    def anonymous_cached(self, request, view, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return view(request, *args, **kwargs)
+        response, locked = lookup(request)
+        if response is not None:
+            return response
+        try:
+            return store(request, view(request, *args, **kwargs))
+        finally:
+            if locked:
+                release(request)
+
+    def list(self, request, *args, **kwargs):
+        return self.anonymous_cached(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.anonymous_cached(
+            request, super().retrieve, *args, **kwargs
+        )
@@ -0,0 +1,129 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+from recipes.models import Ingredient
+from .cache import get_version
+
+SEARCH_LIMIT = 100
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Строки хранятся отсортированными по названию в нижнем регистре:
+    совпадения по началу названия ищутся бинарным поиском, а по подстроке —
+    через str.find по склеенным названиям. Индекс загружается при первом
+    обращении и заново строится, если версия справочника в общем кеше
+    изменилась в другом процессе.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []
+        self._rows = {}
+        self._text = None
+        self._offsets = []
+        self.version = None
+
+    def load(self):
+        with self._lock:
+            version = get_version('ingredients')
+            rows = Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+            self._rows = {
+                pk: {'id': pk, 'name': name, 'measurement_unit': unit}
+                for pk, name, unit in rows
+            }
+            self._keys = sorted(
+                self._key(row) for row in self._rows.values()
+            )
+            self._text = None
+            self.version = version
+
+    def ensure_loaded(self):
+        if self.version != get_version('ingredients'):
+            self.load()
+
+    @staticmethod
+    def _key(row):
+        return (row['name'].lower(), row['measurement_unit'], row['id'])
+
+    def update(self, instance):
+        """Добавить или заменить ингредиент без полной перезагрузки.
+
+        Вызывается после увеличения версии справочника, поэтому индекс
+        принимает новую версию как свою.
+        """
+        with self._lock:
+            if self.version is None:
+                return
+            self.version = get_version('ingredients')
+            self._discard(instance.pk)
+            row = {
+                'id': instance.pk,
+                'name': instance.name,
+                'measurement_unit': instance.measurement_unit,
+            }
+            self._rows[instance.pk] = row
+            insort(self._keys, self._key(row))
+            self._text = None
+
+    def delete(self, pk):
+        """Убрать ингредиент из индекса."""
+        with self._lock:
+            if self.version is None:
+                return
+            self.version = get_version('ingredients')
+            self._discard(pk)
+            self._text = None
+
+    def _discard(self, pk):
+        row = self._rows.pop(pk, None)
+        if row is not None:
+            key = self._key(row)
+            index = bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                del self._keys[index]
+
+    def _build_text(self):
+        offsets = []
+        position = 0
+        for name, _, _ in self._keys:
+            offsets.append(position)
+            position += len(name) + 1
+        self._offsets = offsets
+        self._text = '\n'.join(name for name, _, _ in self._keys)
+
+    def all(self):
+        """Все ингредиенты в порядке сортировки по названию."""
+        self.ensure_loaded()
+        return [self._rows[pk] for _, _, pk in self._keys]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        self.ensure_loaded()
+        query = query.lower()
+        if not query:
+            return self.all()[:limit]
+        with self._lock:
+            keys = self._keys
+            start = bisect_left(keys, (query,))
+            end = bisect_right(keys, (query + '\uffff',), lo=start)
+            found = [pk for _, _, pk in keys[start:min(end, start + limit)]]
+            if len(found) < limit and '\n' not in query:
+                if self._text is None:
+                    self._build_text()
+                text, offsets = self._text, self._offsets
+                seen = set()
+                position = text.find(query)
+                while position != -1 and len(found) < limit:
+                    index = bisect_right(offsets, position) - 1
+                    if index not in seen and not start <= index < end:
+                        seen.add(index)
+                        found.append(keys[index][2])
+                    position = text.find(query, position + 1)
+            return [self._rows[pk] for pk in found]
+
+
+ingredient_index = IngredientIndex()
@@ -1,13 +1,16 @@
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from recipes.models import (
-    FavoriteRecipe, Ingredient, IngredientsRecipe,
-    Recipe, ShoppingCartRecipe, Tag
+    Ingredient, IngredientsRecipe, Recipe, Tag
     )
 from users.models import Follow, User
+from . import shopping_list
 from .fields import Base64ImageField
+from .relations import get_relations
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -44,13 +47,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(
-            user=user,
-            following=obj
-        ).exists()
+        return obj.pk in get_relations(self.context).following
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -165,23 +162,11 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_favorited(self, obj):
         """Определяет есть ли рецепт в избранном"""
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return FavoriteRecipe.objects.filter(
-            user=user,
-            recipe=obj
-        ).exists()
+        return obj.pk in get_relations(self.context).favorites
 
     def get_is_in_shopping_cart(self, obj):
         """Определяет есть ли рецепт в корзине."""
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return ShoppingCartRecipe.objects.filter(
-            user=user,
-            recipe=obj
-        ).exists()
+        return obj.pk in get_relations(self.context).cart
 
     def validate(self, data):
         """ Валидация ингредиентов в рецепте."""
@@ -189,33 +174,85 @@ class RecipeSerializer(serializers.ModelSerializer):
         if not ingredients:
             raise serializers.ValidationError({
                 'ingredients': 'Нужен хоть один ингридиент для рецепта'})
-        ingredient_list = []
+        ingredient_ids = set()
         for ingredient_item in ingredients:
-            ingredient = get_object_or_404(Ingredient,
-                                           id=ingredient_item['id'])
-            if ingredient in ingredient_list:
+            ingredient_id = int(ingredient_item['id'])
+            if ingredient_id in ingredient_ids:
                 raise serializers.ValidationError('Ингридиенты должны '
                                                   'быть уникальными')
-            ingredient_list.append(ingredient)
+            ingredient_ids.add(ingredient_id)
             if int(ingredient_item['amount']) < 0:
                 raise serializers.ValidationError({
                     'ingredients': ('Убедитесь, что значение количества '
                                     'ингредиента больше 0')
                 })
-        data['ingredients'] = ingredients
+        found = Ingredient.objects.filter(id__in=ingredient_ids).count()
+        if found != len(ingredient_ids):
+            raise Http404
+        data['ingredients'] = {
+            int(item['id']): int(item['amount']) for item in ingredients
+        }
         return data
 
     def create_ingredients(self, ingredients, recipe):
-        """Создание ингредиентов в рецепте."""
-        for ingredient in ingredients:
-            IngredientsRecipe.objects.create(
+        """Создание ингредиентов в рецепте одним запросом."""
+        IngredientsRecipe.objects.bulk_create(
+            IngredientsRecipe(
                 recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount'),
+                ingredient_id=ingredient_id,
+                amount=amount,
             )
+            for ingredient_id, amount in ingredients.items()
+        )
+
+    def update_ingredients(self, ingredients, recipe):
+        """Изменение только тех ингредиентов рецепта, что поменялись.
+
+        bulk_create() и bulk_update() не вызывают сигналы, поэтому список
+        покупок для них пересчитывается здесь; удаленные строки учитывает
+        сигнал post_delete.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in IngredientsRecipe.objects.filter(recipe=recipe)
+        }
+        removed = current.keys() - ingredients.keys()
+        shopping_list.change_recipe(
+            recipe,
+            {
+                pk: item.amount for pk, item in current.items()
+                if pk not in removed
+            },
+            ingredients,
+        )
+        if removed:
+            IngredientsRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, amount in ingredients.items():
+            item = current.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            IngredientsRecipe.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(
+            {
+                ingredient_id: amount
+                for ingredient_id, amount in ingredients.items()
+                if ingredient_id not in current
+            },
+            recipe,
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
-        """ Создание рецепта."""
+        """ Создание рецепта.
+
+        Поисковый индекс пересчитывается после коммита, когда
+        ингредиенты уже записаны.
+        """
         image = validated_data.pop('image')
         ingredients_data = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(image=image, **validated_data)
@@ -224,19 +261,34 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.create_ingredients(ingredients_data, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        """ Обновление рецепта."""
+        """ Обновление рецепта.
+
+        tags.set() сам добавляет и удаляет только изменившиеся теги,
+        поисковый индекс пересчитывает сигнал сохранения рецепта.
+        """
         tags_data = self.initial_data.get('tags')
         ingredients_data = validated_data.pop('ingredients')
-        IngredientsRecipe.objects.filter(recipe=recipe).delete()
-        self.create_ingredients(ingredients_data, recipe)
+        if 'image' in validated_data:
+            validated_data['has_thumbnails'] = False
+        self.update_ingredients(ingredients_data, recipe)
         recipe.tags.set(tags_data)
         return super().update(recipe, validated_data)
 
 
+class RecipeMatchSerializer(RecipeSerializer):
+    """ Рецепт с долей имеющихся ингредиентов и числом недостающих."""
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('coverage', 'missing')
+
+
 class ShortRecipeSerialazer(serializers.ModelSerializer):
     """ Сериализатор для моделей корзина и избранные рецепты."""
-    image = Base64ImageField()
+    image = Base64ImageField(variant='small')
 
     class Meta:
         model = Recipe
@@ -269,16 +321,12 @@ class SubscribeSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Определяет подписан ли пользователь на автора."""
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(
-            user=user,
-            following=obj
-        ).exists()
+        return obj.pk in get_relations(self.context).following
 
     def get_recipes(self, obj):
         """Получить количество рецепты."""
+        if hasattr(obj, 'limited_recipes'):
+            return ShortRecipeSerialazer(obj.limited_recipes, many=True).data
         limit = self.context['request'].query_params.get('recipes_limit')
         if limit is None:
             recipes = obj.recipes.all()
@@ -288,4 +336,6 @@ class SubscribeSerializer(serializers.ModelSerializer):
 
     def get_recipes_count(self, obj):
         """Получить количество рецептов автора."""
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.id).count()
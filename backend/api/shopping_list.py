@@ -0,0 +1,126 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from recipes.models import (
+    IngredientsRecipe, ShoppingCartRecipe, ShoppingListItem
+)
+
+
+def recipe_amounts(recipe):
+    """Количество каждого ингредиента в рецепте."""
+    return dict(
+        IngredientsRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount')
+    )
+
+
+def apply_delta(user_ids, delta):
+    """Изменить суммы ингредиентов у пользователей на величину delta.
+
+    Недостающие строки создаются, обнулившиеся удаляются; сама прибавка
+    выполняется одним UPDATE с F(), поэтому параллельные изменения
+    не теряются.
+    """
+    delta = {pk: amount for pk, amount in delta.items() if amount}
+    user_ids = list(user_ids)
+    if not delta or not user_ids:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+            for user_id in user_ids
+            for ingredient_id, amount in delta.items()
+            if amount > 0
+        ),
+        ignore_conflicts=True,
+    )
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=delta
+    )
+    items.update(total_amount=Greatest(
+        F('total_amount') + Case(
+            *(
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in delta.items()
+            ),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    ))
+    items.filter(total_amount__lte=0).delete()
+
+
+def cart_amounts(recipe_ids):
+    """Суммарное количество ингредиентов в нескольких рецептах."""
+    return dict(
+        IngredientsRecipe.objects.filter(
+            recipe__in=recipe_ids
+        ).values('ingredient').annotate(
+            total=Sum('amount')
+        ).order_by().values_list('ingredient', 'total')
+    )
+
+
+def add_recipes(user_id, recipe_ids):
+    """Учесть рецепты, добавленные в корзину."""
+    apply_delta([user_id], cart_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Учесть рецепты, убранные из корзины."""
+    apply_delta([user_id], {
+        pk: -amount for pk, amount in cart_amounts(recipe_ids).items()
+    })
+
+
+def change_recipe(recipe, old, new):
+    """Учесть изменение ингредиентов рецепта во всех корзинах с ним."""
+    delta = Counter(new)
+    delta.subtract(old)
+    apply_delta(cart_users(recipe), delta)
+
+
+def change_row(old, new):
+    """Учесть изменение одной строки ингредиента рецепта во всех корзинах.
+
+    old и new — (recipe_id, ingredient_id, amount) до и после изменения,
+    None для созданной или удаленной строки.
+    """
+    deltas = defaultdict(Counter)
+    if old is not None:
+        deltas[old[0]][old[1]] -= old[2]
+    if new is not None:
+        deltas[new[0]][new[1]] += new[2]
+    for recipe_id, delta in deltas.items():
+        apply_delta(cart_users(recipe_id), delta)
+
+
+def cart_users(recipe):
+    return ShoppingCartRecipe.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True)
+
+
+def aggregate_shopping_list(user_ids=None):
+    """Суммы ингредиентов, посчитанные заново по корзинам.
+
+    Пользователи фильтруются до группировки: filter() по многозначной
+    связи после annotate() добавил бы второй JOIN и удвоил суммы.
+    """
+    carts = ShoppingCartRecipe.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user__in=user_ids)
+    rows = carts.values(
+        'user', ingredient=F('recipe__ingredient_recipes__ingredient')
+    ).annotate(
+        amount=Sum('recipe__ingredient_recipes__amount')
+    ).order_by()
+    return {
+        (row['user'], row['ingredient']): row['amount']
+        for row in rows
+        if row['ingredient'] is not None
+    }
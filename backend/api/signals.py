@@ -0,0 +1,225 @@
+from django.core.cache import cache
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save
+    )
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from recipes.filters import TAG_IDS_CACHE_KEY
+from recipes.models import (
+    FavoriteRecipe, Ingredient, IngredientsRecipe, Recipe,
+    ShoppingCartRecipe, Tag
+    )
+from recipes.search import (
+    schedule_recipe_index, update_recipe_index, update_search_vectors
+    )
+from users.models import Follow, User
+from . import shopping_list
+from .authentication import invalidate_token
+from .cache import invalidate
+from .response_cache import (
+    author_tag, invalidate_recipes, invalidate_tags, recipe_tag, slug_tag
+    )
+from .search import ingredient_index
+from .utils import change_followers, recipes_added, recipes_removed
+
+
+@receiver(pre_save, sender=Tag)
+def remember_tag_slug(sender, instance, **kwargs):
+    """Запомнить прежний slug, чтобы сбросить ответы и с ним."""
+    instance._old_slug = Tag.objects.filter(
+        pk=instance.pk
+    ).values_list('slug', flat=True).first()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_cache(sender, instance, **kwargs):
+    """Сбросить кеш тегов и ответы с рецептами этого тега."""
+    invalidate('tags')
+    cache.delete(TAG_IDS_CACHE_KEY)
+    slugs = {instance.slug, getattr(instance, '_old_slug', None)}
+    invalidate_tags(slug_tag(slug) for slug in slugs if slug)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Сбросить количество и ответы, где рецепт появился или пропал
+    из-за тегов, в том числе при правке в админке.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    invalidate('recipes')
+    if reverse:
+        slugs = [instance.slug]
+        recipe_ids = pk_set or instance.recipe_set.values_list(
+            'pk', flat=True
+        )
+    else:
+        tags = Tag.objects.filter(recipe=instance)
+        if pk_set is not None:
+            tags = Tag.objects.filter(pk__in=pk_set)
+        slugs = tags.values_list('slug', flat=True)
+        recipe_ids = [instance.pk]
+    invalidate_tags([
+        *(slug_tag(slug) for slug in slugs),
+        *(recipe_tag(pk) for pk in recipe_ids),
+    ])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredients(sender, instance, created, **kwargs):
+    """Сбросить кеш ингредиентов и обновить индексы поиска."""
+    invalidate('ingredients')
+    ingredient_index.update(instance)
+    if not created:
+        recipes = Recipe.objects.filter(ingredients=instance)
+        update_search_vectors(recipes)
+        invalidate_recipes(recipes.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def invalidate_ingredient_recipes(sender, instance, **kwargs):
+    """Сбросить ответы с рецептами, из которых удаляется ингредиент."""
+    invalidate_recipes(IngredientsRecipe.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Ingredient)
+def delete_ingredients(sender, instance, **kwargs):
+    """Сбросить кеш ингредиентов и убрать ингредиент из индексов."""
+    invalidate('ingredients')
+    ingredient_index.delete(instance.pk)
+    update_recipe_index(
+        Recipe.objects.filter(ingredient_ids__contains=[instance.pk])
+    )
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    """Сбросить кеш аутентификации при выходе пользователя."""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    """Сбросить кеш аутентификации при изменении пользователя.
+
+    Сюда попадают смена пароля и деактивация.
+    """
+    for key in Token.objects.filter(
+        user_id=instance.pk
+    ).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(sender, instance, update_fields=None,
+                                **kwargs):
+    """Сбросить ответы с рецептами пользователя при изменении профиля."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_tags([author_tag(instance.pk)])
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_counts(sender, instance, created=True, **kwargs):
+    """Сбросить кеш количества рецептов и ответы с рецептом.
+
+    Новый или удаленный рецепт меняет все списки, измененный — свои
+    страницы и результаты поиска.
+    """
+    invalidate('recipes')
+    tags = {recipe_tag(instance.pk)}
+    tags.add('recipes' if created else 'search')
+    invalidate_tags(tags)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user_counts(sender, created=True, **kwargs):
+    """Сбросить кеш количества пользователей при их появлении и удалении."""
+    if created:
+        invalidate('users')
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCartRecipe)
+def add_user_recipe(sender, instance, created, raw=False, **kwargs):
+    """Учесть рецепт, добавленный в избранное или корзину через ORM.
+
+    Растут счетчик рецепта и, для корзины, список покупок. API вставляет
+    строки через insert_rows() и обновляет их сам.
+    """
+    if created and not raw:
+        recipes_added(sender, instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCartRecipe)
+def remove_user_recipe(sender, instance, **kwargs):
+    """Учесть рецепт, убранный из избранного или корзины через ORM.
+
+    Сюда попадают админка и каскадное удаление рецепта или
+    пользователя. При каскаде строки корзины и ингредиентов удаляются
+    по очереди, а каждая пара (корзина, ингредиент) вычитается один
+    раз — вместе с той строкой, что удалена первой.
+    """
+    recipes_removed(sender, instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Follow)
+def add_follower(sender, instance, created, raw=False, **kwargs):
+    """Учесть подписку, созданную через ORM."""
+    if created and not raw:
+        change_followers(instance.following_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_follower(sender, instance, **kwargs):
+    """Учесть подписку, удаленную через ORM, в том числе каскадом."""
+    change_followers(instance.following_id, -1)
+
+
+def ingredient_row(instance):
+    return instance.recipe_id, instance.ingredient_id, instance.amount
+
+
+@receiver(pre_save, sender=IngredientsRecipe)
+def remember_ingredient_row(sender, instance, raw=False, **kwargs):
+    """Запомнить строку до изменения, например в админке."""
+    instance._old_row = None
+    if instance.pk is not None and not raw:
+        instance._old_row = IngredientsRecipe.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, raw=False, **kwargs):
+    """Пересчитать поисковый индекс рецепта, в том числе из админки."""
+    if not raw:
+        schedule_recipe_index(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=IngredientsRecipe)
+def update_ingredients_search(sender, instance, raw=False, **kwargs):
+    """Пересчитать индекс рецепта после изменения его ингредиентов."""
+    if not raw:
+        schedule_recipe_index(instance.recipe_id)
+
+
+@receiver(post_save, sender=IngredientsRecipe)
+def change_shopping_list_row(sender, instance, raw=False, **kwargs):
+    """Пересчитать списки покупок с рецептом после изменения строки."""
+    if not raw:
+        shopping_list.change_row(
+            getattr(instance, '_old_row', None), ingredient_row(instance)
+        )
+
+
+@receiver(post_delete, sender=IngredientsRecipe)
+def delete_shopping_list_row(sender, instance, **kwargs):
+    """Убрать удаленный ингредиент рецепта из списков покупок."""
+    shopping_list.change_row(ingredient_row(instance), None)
@@ -0,0 +1,553 @@
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+import pytest
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import feed
+from api.authentication import _local_cache, remember
+from api.compiled import RECIPE_FIELDS, CompiledRecipeSerializer
+from api.pagination import CachedCountPaginator
+from api.relations import UserRelations
+from api.response_cache import LOCK_KEY, signature
+from api.serializers import RecipeSerializer
+from api.views import (
+    get_recipes_queryset, get_shopping_list_queryset,
+    get_subscriptions_queryset
+    )
+from api.shopping_list import aggregate_shopping_list
+from recipes.filters import RecipeFilter
+from recipes.models import (
+    FavoriteRecipe, FeedItem, Ingredient, IngredientsRecipe, Recipe,
+    ShoppingCartRecipe, ShoppingListItem, Tag
+    )
+from users.models import Follow, User
+
+
+@pytest.fixture(autouse=True)
+def local_cache(settings):
+    """Тестам не нужен memcached: кеш в памяти процесса."""
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+    cache.clear()
+
+
+@pytest.fixture
+def reader():
+    author = User.objects.create(
+        email='author@foodgram.ru', username='author',
+        first_name='Автор', last_name='Рецептов',
+    )
+    reader = User.objects.create(
+        email='reader@foodgram.ru', username='reader',
+        first_name='Читатель', last_name='Рецептов',
+    )
+    tags = Tag.objects.bulk_create(
+        Tag(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag-{i}')
+        for i in range(3)
+    )
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+        for i in range(5)
+    )
+    recipes = Recipe.objects.bulk_create(
+        Recipe(
+            author=author, name=f'Рецепт {i}', text='Описание',
+            image='recipes/images/test.png', cooking_time=10,
+        )
+        for i in range(12)
+    )
+    for recipe in recipes:
+        recipe.tags.set(tags[:2])
+    IngredientsRecipe.objects.bulk_create(
+        IngredientsRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+        for recipe in recipes
+        for ingredient in ingredients
+    )
+    FavoriteRecipe.objects.create(user=reader, recipe=recipes[0])
+    Follow.objects.create(user=reader, following=author)
+    return reader
+
+
+def count_queries(client, url):
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('compiled', (True, False))
+def test_recipe_list_queries_do_not_depend_on_page_size(
+        reader, settings, compiled):
+    """Число запросов списка рецептов одинаково для страниц 2 и 10."""
+    settings.RECIPE_COMPILED_SERIALIZER = compiled
+    client = APIClient()
+    client.force_authenticate(reader)
+    counts = {
+        limit: count_queries(client, f'/api/recipes/?limit={limit}')
+        for limit in (2, 10)
+    }
+    assert counts == {2: 8, 10: 8}
+
+
+def test_token_local_cache_is_bounded(settings):
+    settings.TOKEN_LOCAL_CACHE_SIZE = 3
+    settings.TOKEN_LOCAL_CACHE_TIMEOUT = 5
+    _local_cache.clear()
+    remember('expired', b'', now=-10)
+    for key in ('a', 'b', 'c', 'd'):
+        remember(key, b'', now=0)
+    assert list(_local_cache) == ['b', 'c', 'd']
+    _local_cache.clear()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('number', ('0', '-1'))
+def test_estimated_count_keeps_lower_page_bound(number):
+    """При оценке количества страницы меньше 1 все равно ошибка."""
+    cache.set('count:estimate', (100, False))
+    paginator = CachedCountPaginator(
+        Recipe.objects.order_by('id'), 10, count_key='count:estimate'
+    )
+    with pytest.raises(EmptyPage):
+        paginator.page(number)
+
+
+@pytest.mark.django_db
+def test_estimated_count_allows_pages_past_the_end():
+    cache.set('count:estimate', (100, False))
+    paginator = CachedCountPaginator(
+        Recipe.objects.order_by('id'), 10, count_key='count:estimate'
+    )
+    page = paginator.page(20)
+    assert page.number == 20
+    assert list(page) == []
+
+
+def fire(user, method, url, threads):
+    """Одновременно отправить threads одинаковых запросов."""
+    barrier = Barrier(threads)
+
+    def request(_):
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier.wait()
+        try:
+            return getattr(client, method)(url).status_code
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(threads) as executor:
+        return Counter(executor.map(request, range(threads)))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_toggles_keep_counters():
+    """Параллельные добавления и удаления: без 500, счетчики сходятся."""
+    reader, author = User.objects.bulk_create(
+        User(
+            email=f'{name}@foodgram.ru', username=name,
+            first_name=name, last_name=name,
+        )
+        for name in ('reader', 'author')
+    )
+    recipe = Recipe.objects.create(
+        author=author, name='Рецепт', text='Описание',
+        image='recipes/images/test.png', cooking_time=10,
+    )
+    urls = (
+        f'/api/recipes/{recipe.pk}/favorite/',
+        f'/api/recipes/{recipe.pk}/shopping_cart/',
+        f'/api/users/{author.pk}/subscribe/',
+    )
+    for _ in range(2):
+        for method in ('post', 'delete'):
+            for url in urls:
+                statuses = fire(reader, method, url, threads=8)
+                assert not any(code >= 500 for code in statuses), statuses
+                if method == 'post':
+                    success = sum(
+                        count for code, count in statuses.items()
+                        if code < 300
+                    )
+                    assert success == 1, (url, statuses)
+            recipe.refresh_from_db()
+            author.refresh_from_db()
+            assert recipe.favorites_count == FavoriteRecipe.objects.filter(
+                recipe=recipe
+            ).count()
+            assert recipe.cart_count == ShoppingCartRecipe.objects.filter(
+                recipe=recipe
+            ).count()
+            assert author.followers_count == Follow.objects.filter(
+                following=author
+            ).count()
+
+
+@pytest.mark.django_db
+def test_orm_changes_keep_counters(reader):
+    """Счетчики сходятся после правок через ORM и каскадов."""
+    author = User.objects.get(username='author')
+    recipe, other = Recipe.objects.order_by('id')[:2]
+    ShoppingCartRecipe.objects.create(user=reader, recipe=recipe)
+    FavoriteRecipe.objects.create(user=author, recipe=other)
+    FavoriteRecipe.objects.filter(user=reader, recipe=recipe).delete()
+    recipe.refresh_from_db()
+    other.refresh_from_db()
+    author.refresh_from_db()
+    assert (recipe.favorites_count, recipe.cart_count) == (0, 1)
+    assert other.favorites_count == 1
+    assert author.followers_count == 1
+    reader.delete()
+    recipe.refresh_from_db()
+    author.refresh_from_db()
+    assert (recipe.favorites_count, recipe.cart_count) == (0, 0)
+    assert author.followers_count == 0
+
+
+@pytest.mark.django_db
+def test_saving_cached_user_keeps_followers_count(reader):
+    """Смена пароля закешированного пользователя не затирает счетчик."""
+    author = User.objects.get(username='author')
+    author.set_password('old-password')
+    author.save()
+    client = APIClient()
+    token = Token.objects.create(user=author)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert client.get('/api/users/me/').status_code == 200
+    Follow.objects.create(
+        user=User.objects.create(
+            email='fan@foodgram.ru', username='fan',
+            first_name='Фанат', last_name='Рецептов',
+        ),
+        following=author,
+    )
+    response = client.post('/api/users/set_password/', {
+        'current_password': 'old-password',
+        'new_password': 'new-Password-42',
+    })
+    assert response.status_code == 204
+    author.refresh_from_db()
+    assert author.followers_count == 2
+
+
+@pytest.mark.django_db
+def test_fan_out_writes_only_rows_kept_in_feed(settings, monkeypatch):
+    """В полную ленту попадают только рецепты новее ее последней записи."""
+    settings.FEED_SIZE = 3
+    author, other, reader, newcomer = User.objects.bulk_create(
+        User(
+            email=f'{name}@foodgram.ru', username=name,
+            first_name=name, last_name=name,
+        )
+        for name in ('author', 'other', 'reader', 'newcomer')
+    )
+
+    def recipe(owner):
+        return Recipe.objects.create(
+            author=owner, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10,
+        )
+
+    old = [recipe(author), recipe(author)]
+    recent = [recipe(other) for _ in range(3)]
+    newest = recipe(author)
+    for user, following in ((reader, other), (reader, author),
+                            (newcomer, author)):
+        Follow.objects.create(user=user, following=following)
+    FeedItem.objects.bulk_create(
+        FeedItem(user=reader, recipe=item, author=other) for item in recent
+    )
+    written = []
+    bulk_create = FeedItem.objects.bulk_create
+
+    def record(items, **kwargs):
+        items = list(items)
+        written.extend((item.user_id, item.recipe_id) for item in items)
+        return bulk_create(items, **kwargs)
+
+    monkeypatch.setattr(FeedItem.objects, 'bulk_create', record)
+    feed.fan_out_author(author.pk)
+    assert sorted(written) == sorted([
+        (reader.pk, newest.pk),
+        *((newcomer.pk, item.pk) for item in (*old, newest)),
+    ])
+    assert set(FeedItem.objects.filter(
+        user=reader
+    ).values_list('recipe_id', flat=True)) == {
+        recent[1].pk, recent[2].pk, newest.pk
+    }
+
+
+def shopping_lists():
+    return {
+        (item.user_id, item.ingredient_id): item.total_amount
+        for item in ShoppingListItem.objects.all()
+    }
+
+
+@pytest.mark.django_db
+def test_shopping_list_follows_carts_and_recipes(reader):
+    """Список покупок совпадает с пересчетом по корзинам после правок."""
+    author = User.objects.get(username='author')
+    first, second, third = Recipe.objects.order_by('id')[:3]
+    ingredient = Ingredient.objects.first()
+    for user in (reader, author):
+        for recipe in (first, second, third):
+            ShoppingCartRecipe.objects.create(user=user, recipe=recipe)
+    assert shopping_lists() == aggregate_shopping_list()
+    ShoppingCartRecipe.objects.filter(user=reader, recipe=third).delete()
+    assert shopping_lists() == aggregate_shopping_list()
+
+    row = IngredientsRecipe.objects.get(recipe=first, ingredient=ingredient)
+    row.amount = 7
+    row.save()
+    assert shopping_lists() == aggregate_shopping_list()
+    moved = Ingredient.objects.last()
+    IngredientsRecipe.objects.get(recipe=second, ingredient=moved).delete()
+    assert shopping_lists() == aggregate_shopping_list()
+    row.recipe = second
+    row.ingredient = moved
+    row.save()
+    assert shopping_lists() == aggregate_shopping_list()
+
+    second.delete()
+    assert shopping_lists() == aggregate_shopping_list()
+    assert shopping_lists()
+    author.delete()
+    assert shopping_lists() == aggregate_shopping_list() == {}
+
+
+def anonymous_get(url, **extra):
+    response = APIClient().get(url, **extra)
+    assert response.status_code == 200
+    return response.content.decode()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('change', ('recipe', 'tag', 'author'))
+def test_cached_responses_are_evicted_by_tags(
+        reader, change, django_capture_on_commit_callbacks):
+    """Правка рецепта, slug тега или профиля автора сбрасывает ответы."""
+    recipe = Recipe.objects.order_by('-id').first()
+    urls = ('/api/recipes/', f'/api/recipes/{recipe.pk}/')
+    before = [anonymous_get(url) for url in urls]
+    Recipe.objects.filter(pk=recipe.pk).update(text='Без сигналов')
+    assert [anonymous_get(url) for url in urls] == before
+    recipe.refresh_from_db()
+    with django_capture_on_commit_callbacks(execute=True):
+        if change == 'recipe':
+            recipe.name = 'Новое название'
+            recipe.save()
+        elif change == 'tag':
+            tag = recipe.tags.first()
+            tag.slug = 'new-slug'
+            tag.save()
+        else:
+            recipe.author.first_name = 'Новое имя'
+            recipe.author.save()
+    for url, old in zip(urls, before):
+        content = anonymous_get(url)
+        assert content != old
+        assert 'Без сигналов' in content
+
+
+@pytest.mark.django_db
+def test_cached_responses_are_kept_per_host_and_scheme(reader):
+    url = '/api/recipes/'
+    plain = anonymous_get(url, HTTP_HOST='one.example')
+    assert 'http://one.example/' in plain
+    assert 'http://two.example/' in anonymous_get(
+        url, HTTP_HOST='two.example'
+    )
+    assert 'https://one.example/' in anonymous_get(
+        url, HTTP_HOST='one.example', secure=True
+    )
+    assert anonymous_get(url, HTTP_HOST='one.example') == plain
+
+
+@pytest.mark.django_db
+def test_stale_response_lock_is_released_by_its_holder(reader, settings):
+    """Устаревший ответ пересчитывает и разблокирует один запрос."""
+    settings.RESPONSE_CACHE_TIMEOUT = 0
+    url = '/api/recipes/'
+    lock_key = LOCK_KEY.format(
+        signature=signature(Request(APIRequestFactory().get(url)))
+    )
+    anonymous_get(url)
+    Recipe.objects.update(text='Пересчитано')
+    cache.set(lock_key, 'other', 30)
+    assert 'Пересчитано' not in anonymous_get(url)
+    assert cache.get(lock_key) == 'other'
+    cache.delete(lock_key)
+    assert 'Пересчитано' in anonymous_get(url)
+    assert cache.get(lock_key) is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('anonymous', (True, False))
+@pytest.mark.parametrize('variant', ('medium', None))
+@pytest.mark.parametrize('index', (None, 0, 5))
+def test_compiled_serializer_matches_drf_bytes(
+        reader, anonymous, variant, index):
+    """CompiledRecipeSerializer выдает те же байты, что RecipeSerializer.
+
+    index None — страница списка, иначе один рецепт: первый с
+    миниатюрами, шестой без них.
+    """
+    recipes = Recipe.objects.order_by('-id')
+    Recipe.objects.filter(
+        pk__in=recipes.values('pk')[:3]
+    ).update(has_thumbnails=True)
+    ShoppingCartRecipe.objects.create(user=reader, recipe=recipes[0])
+    FavoriteRecipe.objects.create(user=reader, recipe=recipes[5])
+    user = AnonymousUser() if anonymous else reader
+    request = Request(APIRequestFactory().get('/api/recipes/'))
+    request.user = user
+    context = {'request': request, 'relations': UserRelations.load(user)}
+    if variant:
+        context['image_variant'] = variant
+    regular = get_recipes_queryset(recipes)[:6]
+    compiled = recipes.values(*RECIPE_FIELDS)[:6]
+    many = index is None
+    if not many:
+        regular, compiled = regular[index], compiled[index]
+    expected = JSONRenderer().render(
+        RecipeSerializer(regular, many=many, context=context).data
+    )
+    assert JSONRenderer().render(CompiledRecipeSerializer(
+        compiled, many=many, context=context
+    ).data) == expected
+    flags = (b'"is_subscribed":true', b'"is_favorited":true',
+             b'"is_in_shopping_cart":true')
+    if anonymous:
+        assert not any(flag in expected for flag in flags)
+    elif many:
+        assert all(flag in expected for flag in flags)
+    thumbnail = variant and index != 5
+    assert (b'/thumbnails/' in expected) == bool(thumbnail)
+
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from walk(child)
+
+
+def explain(sql):
+    """Узлы плана PostgreSQL для запроса."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return list(walk(plan[0]['Plan']))
+
+
+def plan_scans(run):
+    """Узлы планов SELECT-запросов функции run: (тип, таблица, индекс).
+
+    Последовательное чтение отключено: на нескольких строках тестовых
+    данных планировщик иначе всегда выбирает его, а тесту важно, что
+    запрос вообще может пройти по индексу.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+    with CaptureQueriesContext(connection) as queries:
+        run()
+    return [
+        (node['Node Type'], node.get('Relation Name'),
+         node.get('Index Name'))
+        for query in queries.captured_queries
+        if query['sql'].startswith('SELECT')
+        for node in explain(query['sql'])
+    ]
+
+
+def get_request(reader, **params):
+    request = Request(APIRequestFactory().get('/api/', params))
+    request.user = reader
+    return request
+
+
+def filter_recipes(reader, **params):
+    list(get_recipes_queryset(RecipeFilter(
+        params, queryset=Recipe.objects.all(),
+        request=get_request(reader, **params),
+    ).qs)[:6])
+
+
+def followed_author(reader):
+    return Follow.objects.filter(user=reader).values_list(
+        'following', flat=True
+    ).get()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('run, indexes', (
+    (lambda reader: filter_recipes(reader, author=followed_author(reader)),
+     ('recipe_author_id_idx', 'ingredient_recipe_recipe_idx')),
+    (lambda reader: filter_recipes(reader, ordering='popular'),
+     ('recipe_popular_idx',)),
+    (lambda reader: filter_recipes(reader, is_favorited=1),
+     ('unique_favorit_recipe',)),
+    (lambda reader: filter_recipes(reader, is_in_shopping_cart=1),
+     ('unique_cart_recipe',)),
+    (lambda reader: list(get_shopping_list_queryset(reader)),
+     ('unique_shopping_list_item',)),
+    (lambda reader: list(get_subscriptions_queryset(
+        get_request(reader, recipes_limit=3)
+    )[:6]), ('unique_followers', 'recipe_author_id_idx')),
+    (lambda reader: list(Follow.objects.filter(
+        following=followed_author(reader)
+    ).values_list('user_id', flat=True)), ('follow_following_user_idx',)),
+    (lambda reader: list(Ingredient.objects.filter(
+        name__istartswith='ингредиент'
+    )), ('ingredient_name_upper_idx',)),
+), ids=(
+    'author', 'popular', 'is_favorited', 'is_in_shopping_cart',
+    'download_shopping_cart', 'subscriptions', 'followers', 'ingredients',
+))
+def test_queries_read_tables_by_index(reader, run, indexes):
+    """Фильтры рецептов, список покупок и подписки идут по индексам."""
+    ShoppingCartRecipe.objects.create(
+        user=reader, recipe=Recipe.objects.first()
+    )
+    scans = plan_scans(lambda: run(reader))
+    used = {index for node, _, index in scans if node in INDEX_SCANS}
+    assert set(indexes) <= used, scans
+
+
+@pytest.mark.django_db
+def test_tag_filter_reads_recipe_tags_by_index(reader):
+    """Фильтр по тегам проверяет связь рецепта с тегом по индексу."""
+    table = Recipe.tags.through._meta.db_table
+    with connection.cursor() as cursor:
+        indexes = {
+            name for name, constraint in
+            connection.introspection.get_constraints(cursor, table).items()
+            if constraint['index']
+        }
+    scans = plan_scans(
+        lambda: filter_recipes(reader, tags=['tag-0', 'tag-1'])
+    )
+    assert ('Seq Scan', table, None) not in scans
+    assert indexes & {index for _, _, index in scans}, scans
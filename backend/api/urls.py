@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .metrics import MetricsView
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
 from django.conf import settings
 
@@ -13,6 +14,24 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 app_name = 'api'
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
+
+if settings.ASYNC_READS:
+    from . import async_views
+
+    urlpatterns[1:1] = [
+        path('recipes/', async_views.recipe_list, name='recipes-list'),
+        path('recipes/<int:pk>/', async_views.recipe_detail,
+             name='recipes-detail'),
+        path('tags/', async_views.tag_list, name='tags-list'),
+        path('tags/<int:pk>/', async_views.tag_detail, name='tags-detail'),
+        path('ingredients/', async_views.ingredient_list,
+             name='ingredients-list'),
+        path('ingredients/<int:pk>/', async_views.ingredient_detail,
+             name='ingredients-detail'),
+        path('users/subscriptions/', async_views.subscriptions,
+             name='users-subscriptions'),
+    ]
@@ -1,68 +1,212 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
 
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCartRecipe
 from users.models import User
+from . import feed, shopping_list
+from .relations import invalidate_relations
+
+COUNTERS = {
+    FavoriteRecipe: 'favorites_count',
+    ShoppingCartRecipe: 'cart_count',
+}
+
+
+def change_counter(model, recipe_ids, step):
+    """Изменить счетчик рецептов для переданной таблицы."""
+    counter = COUNTERS[model]
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{counter: Greatest(F(counter) + step, 0)}
+    )
+
+
+def lock_user(user):
+    """Заблокировать строку пользователя до конца транзакции.
+
+    Пакетные изменения избранного и корзины пользователя идут по
+    очереди.
+    """
+    list(User.objects.select_for_update().filter(pk=user.pk))
+
+
+def insert_rows(model, user, ids, field='recipe'):
+    """Вставить строки пользователя, кроме уже существующих.
+
+    Возвращает id объектов поля field, строки которых действительно
+    вставлены. Сигналы модели не вызываются.
+    """
+    quote = connection.ops.quote_name
+    column = quote(model._meta.get_field(field).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} '
+            f'(user_id, {column}) SELECT %s, unnest(%s::bigint[]) '
+            f'ON CONFLICT DO NOTHING RETURNING {column}',
+            [user.pk, list(ids)],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def delete_rows(model, user, ids, field='recipe'):
+    """Удалить строки пользователя; id действительно удаленных.
+
+    Сигналы модели не вызываются.
+    """
+    quote = connection.ops.quote_name
+    column = quote(model._meta.get_field(field).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE user_id = %s AND {column} = ANY(%s::bigint[]) '
+            f'RETURNING {column}',
+            [user.pk, list(ids)],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def recipes_added(model, user_id, recipe_ids):
+    """Обновить счетчики и список покупок после вставки строк."""
+    change_counter(model, recipe_ids, 1)
+    if model is ShoppingCartRecipe:
+        shopping_list.add_recipes(user_id, recipe_ids)
+
+
+def recipes_removed(model, user_id, recipe_ids):
+    """Обновить счетчики и список покупок после удаления строк."""
+    change_counter(model, recipe_ids, -1)
+    if model is ShoppingCartRecipe:
+        shopping_list.remove_recipes(user_id, recipe_ids)
+
+
+def change_followers(author_id, step):
+    """Изменить счетчик подписчиков автора."""
+    User.objects.filter(pk=author_id).update(
+        followers_count=Greatest(F('followers_count') + step, 0)
+    )
 
 
 def add_or_del_author(self, **kwargs):
-    """Добавить или удалить автора."""
+    """Добавить или удалить автора.
+
+    Вместе с подпиской меняется счетчик подписчиков автора, а в ленту
+    пользователя дописываются или из нее убираются рецепты автора.
+    """
     request = kwargs['request']
     model = kwargs['model']
     serializer_type = kwargs['serializer']
     user = self.request.user
     following = get_object_or_404(User, id=kwargs['id'])
-    subscribe = model.objects.filter(user=user, following=following)
     if request.method == 'DELETE':
-        subscribe.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
-    else:
-        if following == user:
-            data = {'errors': 'Нельзя подписываться на самого себя'}
-            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
-        elif subscribe.exists():
-            data = {'errors': 'Вы подписаны на данного автора.'}
-            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            model.objects.create(user=user, following=following)
-            serializer = serializer_type(
-                following,
-                context={'request': request},
-            )
-            return Response(
-                serializer.data,
-                status=status.HTTP_201_CREATED
+        with transaction.atomic():
+            deleted = delete_rows(
+                model, user, [following.pk], field='following'
             )
+            if deleted:
+                change_followers(following.pk, -1)
+                feed.unfollow(user, following)
+        invalidate_relations(user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    if following == user:
+        data = {'errors': 'Нельзя подписываться на самого себя'}
+        return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        created = insert_rows(
+            model, user, [following.pk], field='following'
+        )
+        if created:
+            change_followers(following.pk, 1)
+            feed.follow(user, following)
+    if not created:
+        data = {'errors': 'Вы подписаны на данного автора.'}
+        return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+    invalidate_relations(user)
+    serializer = serializer_type(
+        following,
+        context={'request': request},
+    )
+    return Response(
+        serializer.data,
+        status=status.HTTP_201_CREATED
+    )
 
 
 def add_or_del_obj(self, **kwargs):
-    """Добавить или удалить рецепт в переданной таблице."""
+    """Добавить или удалить рецепт в переданной таблице.
+
+    Как и в add_or_del_objs(), счетчик и список покупок меняются, только
+    если INSERT или DELETE действительно изменили строку (RETURNING).
+    """
     recipe = self.get_object()
     model = kwargs['model']
     request = kwargs['request']
     serializer_type = kwargs['serializer']
-    obj_in_table = model.objects.filter(
-        user=self.request.user,
-        recipe=recipe
-    )
+    user = self.request.user
     if request.method == 'POST':
-        if not obj_in_table.exists():
-            model.objects.create(
-                user=self.request.user,
-                recipe=recipe
-            )
-            serilizer = serializer_type(
-                recipe,
-                context={'request': request}
-            )
-            return Response(serilizer.data)
-        else:
+        with transaction.atomic():
+            created = insert_rows(model, user, [recipe.pk])
+            if created:
+                recipes_added(model, user.pk, created)
+        if not created:
             data = {'errors': 'Такой рецепт есть в списке.'}
             return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
-    else:
-        if obj_in_table.exists():
-            obj_in_table.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        invalidate_relations(user)
+        serilizer = serializer_type(
+            recipe,
+            context={'request': request}
+        )
+        return Response(serilizer.data)
+    with transaction.atomic():
+        deleted = delete_rows(model, user, [recipe.pk])
+        if deleted:
+            recipes_removed(model, user.pk, deleted)
+    if not deleted:
+        data = {'errors': 'Такого рецепта нет в списке.'}
+        return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+    invalidate_relations(user)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def add_or_del_objs(self, **kwargs):
+    """Добавить или удалить несколько рецептов в переданной таблице.
+
+    Повторное добавление или удаление рецепта не считается ошибкой.
+    Счетчики и список покупок меняются только для строк, которые INSERT
+    и DELETE действительно вставили или удалили (RETURNING).
+    """
+    model = kwargs['model']
+    request = kwargs['request']
+    serializer_type = kwargs['serializer']
+    user = self.request.user
+    recipe_ids = request.data.get('recipes')
+    if (not isinstance(recipe_ids, list) or not recipe_ids
+            or not all(isinstance(pk, int) for pk in recipe_ids)):
+        data = {'errors': 'Передайте непустой список id рецептов.'}
+        return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+    recipe_ids = set(recipe_ids)
+    recipes = list(Recipe.objects.filter(pk__in=recipe_ids))
+    if len(recipes) != len(recipe_ids):
+        data = {'errors': 'Некоторые рецепты не найдены.'}
+        return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        lock_user(user)
+        if request.method == 'DELETE':
+            deleted = delete_rows(model, user, recipe_ids)
+            if deleted:
+                recipes_removed(model, user.pk, deleted)
         else:
-            data = {'errors': 'Такого рецепта нет в списке.'}
-            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+            created = insert_rows(model, user, recipe_ids)
+            if created:
+                recipes_added(model, user.pk, created)
+    invalidate_relations(user)
+    if request.method == 'DELETE':
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    serilizer = serializer_type(
+        recipes,
+        many=True,
+        context={'request': request}
+    )
+    return Response(serilizer.data)
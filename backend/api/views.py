@@ -1,34 +1,146 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
 from djoser.views import UserViewSet
-from rest_framework import permissions
+from rest_framework import permissions, status
 from rest_framework.decorators import action, permission_classes
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.filters import RecipeFilter, IngredientSearchFilter
+from recipes.filters import RecipeFilter
 from recipes.models import (
     FavoriteRecipe, Ingredient, IngredientsRecipe,
-    Recipe, ShoppingCartRecipe, Tag
+    Recipe, ShoppingCartRecipe, ShoppingListItem, Tag
     )
 from recipes.permissions import (
     IsAdminOrReadOnly,
     IsOwnerOrReadOnly
     )
+from recipes.search import match_ingredients
 from users.models import Follow, User
 from .serializers import (
     IngredientSerializer,
-    RecipeSerializer, ShortRecipeSerialazer,
+    RecipeMatchSerializer, RecipeSerializer, ShortRecipeSerialazer,
     SubscribeSerializer, TagSerializer, UserSerializer
     )
-from .utils import add_or_del_author, add_or_del_obj
+from .cache import ReferenceCacheMixin
+from .compiled import RECIPE_FIELDS, CompiledRecipeSerializer
+from .exports import EXPORT_FORMATS
+from .feed import feed_page, push_recipe
+from .images import schedule_thumbnails
+from .relations import get_relations, relations_scope
+from .response_cache import AnonymousResponseCacheMixin
+from .search import ingredient_index
+from .utils import add_or_del_author, add_or_del_obj, add_or_del_objs
 from .pagination import LimitPageNumberPagination
 
 
+def get_recipes_queryset(queryset=None):
+    """ Рецепты со связанными объектами.
+
+    Автор, теги и ингредиенты загружаются заранее, а флаги текущего
+    пользователя берутся из UserRelations, поэтому число запросов
+    не зависит от размера страницы. Широкий search_vector не читается.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    return queryset.defer(
+        'search_vector'
+    ).select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredient_recipes',
+            queryset=IngredientsRecipe.objects.select_related('ingredient'),
+        ),
+    )
+
+
+def get_subscriptions_queryset(request):
+    """ Авторы, на которых подписан пользователь, для ленты подписок.
+
+    Количество рецептов считается аннотацией, первые recipes_limit рецептов
+    каждого автора загружаются одним запросом.
+    """
+    recipes = Recipe.objects.defer('search_vector')
+    limit = request.query_params.get('recipes_limit')
+    if limit is not None and limit.isdigit():
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).values('pk')[:int(limit)]
+        ))
+    return User.objects.filter(following__user=request.user).annotate(
+        recipes_count=Count('recipes', distinct=True),
+    ).order_by('id').prefetch_related(
+        Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+    )
+
+
+def get_shopping_list_queryset(user):
+    """ Строки списка покупок пользователя для выгрузки."""
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit',
+        ingredient_amount=F('total_amount'),
+    ).order_by('ingredient__name')
+
+
 class UserViewSet(UserViewSet):
     """ Вьюсет модели User."""
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = LimitPageNumberPagination
+    cursor_ordering = 'id'
+
+    def get_count_scopes(self):
+        if self.action == 'subscriptions':
+            return ['users', relations_scope(self.request.user)]
+        return ['users']
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['relations'] = get_relations(context)
+        if self.action == 'feed':
+            context['image_variant'] = 'medium'
+        return context
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+        )
+    def feed(self, request):
+        """ Новые рецепты авторов, на которых подписан пользователь.
+
+        Страницы идут по ключу: параметр before — id последнего рецепта
+        предыдущей страницы, ссылка на следующую страницу в next.
+        """
+        before = request.query_params.get('before')
+        if before is not None and not before.isdigit():
+            data = {'errors': 'before должен быть id рецепта.'}
+            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+        ids, has_next = feed_page(
+            request.user,
+            None if before is None else int(before),
+            min(self.paginator.get_page_size(request), settings.FEED_SIZE),
+        )
+        recipes = get_recipes_queryset(
+            Recipe.objects.filter(pk__in=ids)
+        ).order_by('-id')
+        serializer = RecipeSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        next_url = None
+        if has_next:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'before', ids[-1]
+            )
+        return Response({'next': next_url, 'results': serializer.data})
 
     @action(
         methods=['GET'],
@@ -37,13 +149,12 @@ class UserViewSet(UserViewSet):
     @permission_classes([permissions.IsAuthenticated])
     def subscriptions(self, request):
         """Показывает подписчиков."""
-        user = request.user
-        queryset = User.objects.filter(following__user=user)
+        queryset = get_subscriptions_queryset(request)
         pages = self.paginate_queryset(queryset)
         serializer = SubscribeSerializer(
             pages,
             many=True,
-            context={'request': request}
+            context=self.get_serializer_context()
         )
         return self.get_paginated_response(serializer.data)
 
@@ -63,35 +174,88 @@ class UserViewSet(UserViewSet):
         )
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
     """ Вьюсет модели Tag."""
+    cache_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (IsAdminOrReadOnly,)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, ReadOnlyModelViewSet):
     """ Возвращает список всех ингредиентов из БД."""
+    cache_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter,)
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
-    search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.search)
 
-class RecipeViewSet(ModelViewSet):
+    def search(self, request):
+        """ Поиск по названию через индекс в памяти процесса."""
+        name = request.query_params.get('name')
+        if name is None:
+            return Response(ingredient_index.all())
+        return Response(ingredient_index.search(name))
+
+
+class RecipeViewSet(AnonymousResponseCacheMixin, ModelViewSet):
     """ Вьюсет модели Recipe."""
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     filterset_class = (RecipeFilter)
     pagination_class = LimitPageNumberPagination
     permission_classes = (IsOwnerOrReadOnly,)
+    cursor_ordering = '-id'
     filter_backends = (DjangoFilterBackend,)
 
+    @property
+    def compiled(self):
+        """ Читать рецепты строками .values() без моделей и DRF-полей."""
+        return (
+            settings.RECIPE_COMPILED_SERIALIZER
+            and self.request.method == 'GET'
+            and self.action in ('list', 'retrieve')
+        )
+
+    def get_queryset(self):
+        if self.compiled:
+            return super().get_queryset().values(*RECIPE_FIELDS)
+        return get_recipes_queryset(super().get_queryset())
+
+    def get_serializer_class(self):
+        if self.compiled:
+            return CompiledRecipeSerializer
+        return super().get_serializer_class()
+
+    def get_count_scopes(self):
+        params = self.request.query_params
+        user = self.request.user
+        if user.is_authenticated and (
+                'is_favorited' in params or 'is_in_shopping_cart' in params):
+            return ['recipes', relations_scope(user)]
+        return ['recipes']
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['relations'] = get_relations(context)
+        if self.action in ('list', 'cook'):
+            context['image_variant'] = 'medium'
+        return context
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        schedule_thumbnails(recipe)
+        push_recipe(recipe)
+        serializer.instance = self.get_queryset().get(pk=recipe.pk)
+
+    def perform_update(self, serializer):
+        recipe = serializer.save()
+        schedule_thumbnails(recipe)
+        serializer.instance = self.get_queryset().get(pk=recipe.pk)
 
     @action(
         detail=True,
@@ -127,6 +291,78 @@ class RecipeViewSet(ModelViewSet):
             serializer=ShortRecipeSerialazer
         )
 
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=(permissions.IsAuthenticated,),
+        )
+    def favorite_batch(self, request):
+        """ Добавление/удаление нескольких рецептов в/из избранного."""
+        return add_or_del_objs(
+            self,
+            request=request,
+            model=FavoriteRecipe,
+            serializer=ShortRecipeSerialazer
+        )
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart',
+        url_name='shopping_cart-batch',
+        permission_classes=(permissions.IsAuthenticated,),
+        )
+    def shopping_cart_batch(self, request):
+        """ Добавление/удаление нескольких рецептов в/из корзины."""
+        return add_or_del_objs(
+            self,
+            request=request,
+            model=ShoppingCartRecipe,
+            serializer=ShortRecipeSerialazer
+        )
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='cook',
+        url_name='cook',
+        )
+    def cook(self, request):
+        """ Рецепты из имеющихся ингредиентов.
+
+        Параметр ingredients — id ингредиентов через запятую или
+        несколькими параметрами, max_missing — сколько ингредиентов
+        может не хватать. Фильтры RecipeFilter тоже применяются.
+        """
+        ingredient_ids = [
+            pk.strip()
+            for value in request.query_params.getlist('ingredients')
+            for pk in value.split(',')
+            if pk.strip()
+        ]
+        max_missing = request.query_params.get('max_missing')
+        if not ingredient_ids or not all(
+                pk.isdigit() for pk in ingredient_ids):
+            data = {'errors': 'Передайте id ингредиентов в ingredients.'}
+            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+        if max_missing is not None and not max_missing.isdigit():
+            data = {'errors': 'max_missing должен быть целым числом.'}
+            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+        queryset = match_ingredients(
+            self.filter_queryset(self.get_queryset()),
+            {int(pk) for pk in ingredient_ids},
+            None if max_missing is None else int(max_missing),
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeMatchSerializer(
+            page,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         methods=['GET'],
         detail=False,
@@ -134,29 +370,28 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,),
         )
     def download_shopping_cart(self, request):
-        """ Получение списка покупок."""
-        user = request.user
-        file_name = 'shopping_list.txt'
-        ingredients = IngredientsRecipe.objects.filter(
-            recipe__cart_recipes__user=user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            ingredient_amount=Sum('amount')).order_by('ingredient__name')
-        response = HttpResponse(
-            content_type='text/plain',
-            charset='utf-8',
-        )
-        response['Content-Disposition'] = f'attachment; filename={file_name}'
-        if ingredients.exists():
-            response.write('Список продуктов к покупке:\n')
-            for ingredient in ingredients:
-                response.write(
-                    f'\u2610 {ingredient["ingredient__name"].title()} '
-                    f'({ingredient["ingredient__measurement_unit"]}) '
-                    f'- {ingredient["ingredient_amount"]}\n'
-                )
-            response.write('\nПроект Foodgram от Gostinci\n')
-            return response
-        response.write('Ваш список покупок пуст\n')
+        """ Получение списка покупок.
+
+        Формат выбирается параметром type: txt, csv, json или pdf.
+        Под WSGI строки читаются из БД по мере отдачи файла. Под ASGI
+        поток отдается из цикла событий, где запросы к БД запрещены,
+        поэтому строки читаются заранее, еще в потоке вьюхи.
+        """
+        export_class = EXPORT_FORMATS.get(
+            request.query_params.get('type', 'txt')
+        )
+        if export_class is None:
+            data = {'errors': 'Неизвестный формат списка покупок.'}
+            return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
+        export = export_class()
+        ingredients = get_shopping_list_queryset(request.user).iterator()
+        if isinstance(request._request, ASGIRequest):
+            ingredients = list(ingredients)
+        response = StreamingHttpResponse(
+            export.render(ingredients),
+            content_type=export.content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_list.{export.extension}'
+        )
         return response
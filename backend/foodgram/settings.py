@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'users.apps.UsersConfig',
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.QueryMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,6 +63,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Асинхронные GET (ASGI) выполняют ORM в пуле потоков, у каждого потока
+# свое соединение с БД: без CONN_MAX_AGE оно открывалось бы заново на
+# каждый вызов. Для ASGI по умолчанию соединения живут 60 секунд.
+ASYNC_READS = os.getenv('ASYNC_READS') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
@@ -68,7 +75,23 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', default=60 if ASYNC_READS else 0)
+        ),
+    }
+}
+
+# Кеш общий для всех процессов: версии справочников, токены, связи
+# пользователей и кеш ответов сбрасываются в одном месте для всех.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.memcached.PyMemcacheCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='memcached:11211'),
+        'TIMEOUT': 300,
     }
 }
 
@@ -103,6 +126,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static_backend')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', default=2))
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 
@@ -112,7 +139,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'],
@@ -121,6 +148,41 @@ REST_FRAMEWORK = {
     ],
 }
 
+TOKEN_CACHE_TIMEOUT = 300
+TOKEN_LOCAL_CACHE_TIMEOUT = 5
+TOKEN_LOCAL_CACHE_SIZE = 1000
+RELATIONS_CACHE_TIMEOUT = 300
+COUNT_CACHE_TIMEOUT = 60
+REFERENCE_CACHE_TIMEOUT = 3600
+COUNT_ESTIMATE_THRESHOLD = 100000
+RESPONSE_CACHE_TIMEOUT = 60
+RESPONSE_CACHE_STALE = 300
+FEED_SIZE = 500
+FEED_FANOUT_LIMIT = 1000
+
+RECIPE_COMPILED_SERIALIZER = (
+    os.getenv('RECIPE_COMPILED_SERIALIZER', 'True') == 'True'
+)
+
+QUERY_METRICS_HEADERS = os.getenv('QUERY_METRICS_HEADERS') == 'True'
+QUERY_REPEAT_THRESHOLD = 3
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE') == 'True'
+QUERY_BUDGETS = {
+    'recipes-list': 10,
+    'recipes-retrieve': 8,
+    'recipes-create': 18,
+    'recipes-partial_update': 28,
+    'recipes-update': 28,
+    'recipes-favorite': 10,
+    'recipes-shopping_cart': 16,
+    'recipes-download_shopping_cart': 3,
+    'recipes-cook': 10,
+    'users-list': 7,
+    'users-subscriptions': 8,
+    'users-feed': 10,
+    'ingredients-list': 2,
+}
+
 DJOSER = {
     'HIDE_USERS': False,
     'SERIALIZERS': {
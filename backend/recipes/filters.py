@@ -1,32 +1,109 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
-from .models import Recipe
+from .models import FavoriteRecipe, Recipe, ShoppingCartRecipe, Tag
+from .search import search_recipes
 
+TAG_IDS_CACHE_KEY = 'recipes:tag_ids'
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+
+def get_tag_ids(slugs=()):
+    """ Соответствие slug -> id тегов из кеша.
+
+    Если какого-то из slugs в кеше нет, соответствие перечитывается:
+    тег мог добавить другой процесс.
+    """
+    tag_ids = cache.get(TAG_IDS_CACHE_KEY)
+    if tag_ids is None or not tag_ids.keys() >= set(slugs):
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(
+            TAG_IDS_CACHE_KEY, tag_ids,
+            timeout=settings.REFERENCE_CACHE_TIMEOUT,
+        )
+    return tag_ids
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class RecipeFilter(FilterSet):
     """ Фильтр для рецептов по избранному,
-        автору, списку покупок и тегам.
+        автору, списку покупок и тегам, поиск и сортировка по популярности.
     """
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags',
+    )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='get_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_in_shopping_cart', 'is_favorited')
+        fields = (
+            'tags', 'author', 'is_in_shopping_cart', 'is_favorited',
+            'search', 'ordering',
+        )
+
+    def __init__(self, data=None, *args, **kwargs):
+        super().__init__(data, *args, **kwargs)
+        if hasattr(self.data, 'getlist'):
+            slugs = self.data.getlist('tags')
+        else:
+            slugs = (self.data or {}).get('tags')
+        if slugs:
+            get_tag_ids(slugs)
+
+    def filter_user_recipes(self, queryset, model):
+        """ Рецепты из таблицы model текущего пользователя через Exists()."""
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        alias = f'in_{model._meta.model_name}'
+        return queryset.annotate(**{
+            alias: Exists(model.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        }).filter(**{alias: True})
 
     def get_is_favorited(self, queryset, name, value):
         if value:
-            return queryset.filter(favorite_recipes__user=self.request.user)
+            return self.filter_user_recipes(queryset, FavoriteRecipe)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value:
-            return queryset.filter(cart_recipes__user=self.request.user)
+            return self.filter_user_recipes(queryset, ShoppingCartRecipe)
+        return queryset
+
+    def get_tags(self, queryset, name, value):
+        """ Рецепты хотя бы с одним из тегов, без JOIN и distinct()."""
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids()
+        return queryset.annotate(
+            has_tags=Exists(Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=[tag_ids[slug] for slug in value],
+            ))
+        ).filter(has_tags=True)
+
+    def get_search(self, queryset, name, value):
+        """ Поиск по названию, ингредиентам и описанию."""
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by('-favorites_count', '-cart_count', '-id')
         return queryset
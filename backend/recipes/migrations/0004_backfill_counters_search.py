@@ -0,0 +1,92 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+SEARCH_CONFIG = 'russian'
+BATCH_SIZE = 1000
+
+
+class Array(Subquery):
+    template = 'ARRAY(%(subquery)s)'
+    output_field = ArrayField(models.BigIntegerField())
+
+
+def count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def backfill(apps, schema_editor):
+    """Заполнить новые производные поля по существующим данным.
+
+    Счетчики избранного, корзин и подписчиков, поисковые векторы и
+    массивы id ингредиентов рецептов, списки покупок по корзинам.
+    Ленты подписок собирает команда feeds.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientsRecipe = apps.get_model('recipes', 'IngredientsRecipe')
+    FavoriteRecipe = apps.get_model('recipes', 'FavoriteRecipe')
+    ShoppingCartRecipe = apps.get_model('recipes', 'ShoppingCartRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('users', 'Follow')
+    db = schema_editor.connection.alias
+
+    ingredients = IngredientsRecipe.objects.using(db).filter(
+        recipe=OuterRef('pk')
+    ).order_by()
+    Recipe.objects.using(db).update(
+        favorites_count=count(FavoriteRecipe, 'recipe'),
+        cart_count=count(ShoppingCartRecipe, 'recipe'),
+        ingredient_ids=Array(
+            ingredients.order_by('ingredient_id').values('ingredient_id')
+        ),
+        search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(
+                Subquery(ingredients.values('recipe').annotate(
+                    names=StringAgg('ingredient__name', ' ')
+                ).values('names')),
+                weight='B', config=SEARCH_CONFIG,
+            )
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ),
+    )
+    User.objects.using(db).update(followers_count=count(Follow, 'following'))
+
+    totals = ShoppingCartRecipe.objects.using(db).values(
+        'user', ingredient=models.F('recipe__ingredient_recipes__ingredient')
+    ).annotate(
+        amount=Sum('recipe__ingredient_recipes__amount')
+    ).filter(ingredient__isnull=False).order_by()
+    ShoppingListItem.objects.using(db).bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['user'],
+                ingredient_id=row['ingredient'],
+                total_amount=row['amount'],
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_search_counters_feed'),
+        ('users', '0002_user_followers_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import Upper
 
 from users.models import User
 
@@ -48,6 +52,13 @@ class Ingredient(models.Model):
             models.UniqueConstraint(fields=['name', 'measurement_unit'],
                                     name='unique ingredient')
         ]
+        indexes = [
+            # Поиск по началу названия без учета регистра (istartswith).
+            models.Index(
+                OpClass(Upper('name'), name='varchar_pattern_ops'),
+                name='ingredient_name_upper_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name.title()} - ({self.measurement_unit})'
@@ -60,11 +71,17 @@ class Recipe(models.Model):
         related_name='recipes',
         on_delete=models.CASCADE,
         verbose_name='Автор рецепта',
+        db_index=False,
     )
     image = models.ImageField(
         upload_to='recipes/images/',
         verbose_name='Картинка рецепта'
         )
+    has_thumbnails = models.BooleanField(
+        'Миниатюры готовы',
+        default=False,
+        editable=False,
+    )
     name = models.CharField(
         'Название рецепта',
         max_length=200,
@@ -87,11 +104,52 @@ class Recipe(models.Model):
         )],
         verbose_name='Время приготовления',
     )
+    favorites_count = models.PositiveIntegerField(
+        'Кол-во в избранном',
+        default=0,
+        editable=False,
+    )
+    cart_count = models.PositiveIntegerField(
+        'Кол-во в корзинах',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(),
+        verbose_name='id ингредиентов',
+        default=list,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['author', '-id'], name='recipe_author_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-cart_count', '-id'],
+                name='recipe_popular_idx',
+            ),
+            GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+            GinIndex(
+                fields=['ingredient_ids'],
+                name='recipe_ingredient_ids_idx',
+            ),
+            GinIndex(
+                fields=['name'],
+                name='recipe_name_trgm_idx',
+                opclasses=['gin_trgm_ops'],
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} - {self.author}'
@@ -111,6 +169,7 @@ class IngredientsRecipe(models.Model):
         on_delete=models.CASCADE,
         related_name='ingredient_recipes',
         verbose_name='Рецепт',
+        db_index=False,
     )
     ingredient = models.ForeignKey(
         Ingredient,
@@ -128,6 +187,14 @@ class IngredientsRecipe(models.Model):
                 name="unique_ingredient_recipe"
             )
         ]
+        indexes = [
+            # Ингредиенты рецептов страницы без чтения самой таблицы.
+            models.Index(
+                fields=['recipe', 'ingredient'],
+                include=['amount'],
+                name='ingredient_recipe_recipe_idx',
+            ),
+        ]
 
     def __str__(self):
         return f' {self.ingredient}'
@@ -140,12 +207,14 @@ class FavoriteRecipe(models.Model):
         on_delete=models.CASCADE,
         related_name='favorite_recipes',
         verbose_name='Пользователь',
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         related_name='favorite_recipes',
-        verbose_name='Рецепты'
+        verbose_name='Рецепты',
+        db_index=False,
     )
 
     class Meta:
@@ -157,6 +226,11 @@ class FavoriteRecipe(models.Model):
                 fields=['user', 'recipe'], name="unique_favorit_recipe"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='favorite_recipe_user_idx'
+            ),
+        ]
 
 
 class ShoppingCartRecipe(models.Model):
@@ -166,12 +240,14 @@ class ShoppingCartRecipe(models.Model):
         on_delete=models.CASCADE,
         related_name='cart_recipes',
         verbose_name='Пользователь',
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         related_name='cart_recipes',
-        verbose_name='Корзина'
+        verbose_name='Корзина',
+        db_index=False,
     )
 
     class Meta:
@@ -182,3 +258,75 @@ class ShoppingCartRecipe(models.Model):
                 fields=['user', 'recipe'], name="unique_cart_recipe"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='cart_recipe_user_idx'
+            ),
+        ]
+
+
+class ShoppingListItem(models.Model):
+    """ Суммарное количество ингредиента в корзине пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+        db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        'Количество',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Продукт в списке покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.total_amount}'
+
+
+class FeedItem(models.Model):
+    """ Рецепт в ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
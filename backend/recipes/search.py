@@ -0,0 +1,158 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+    )
+from django.db import connections, transaction
+from django.db.models import (
+    BigIntegerField, F, FloatField, Func, IntegerField, OuterRef, Q,
+    Subquery, Value
+    )
+from django.db.models.functions import Cast
+
+from .models import IngredientsRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+
+
+class Array(Subquery):
+    """ARRAY(подзапрос) для столбца-массива."""
+    template = 'ARRAY(%(subquery)s)'
+    output_field = ArrayField(BigIntegerField())
+
+
+class Cardinality(Func):
+    function = 'cardinality'
+    output_field = IntegerField()
+
+
+class MatchCount(Func):
+    """Сколько элементов массива входит в переданный список значений."""
+    template = ('(SELECT COUNT(*) FROM unnest(%(expressions)s) AS item '
+                'WHERE item = ANY(%(values)s))')
+    output_field = IntegerField()
+
+    def __init__(self, array, values):
+        super().__init__(array)
+        self.values = Value(values, output_field=ArrayField(BigIntegerField()))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        values_sql, values_params = compiler.compile(self.values)
+        sql, params = super().as_sql(
+            compiler, connection, values=values_sql, **extra_context
+        )
+        return sql, (*params, *values_params)
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def recipe_search_vector():
+    """Вектор по названию, ингредиентам и описанию рецепта с весами A-C."""
+    ingredient_names = Subquery(
+        IngredientsRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipes):
+    """Пересчитать search_vector у рецептов одним UPDATE.
+
+    На других СУБД ничего не делает: поиск там идет через icontains.
+    """
+    if not is_postgresql(recipes):
+        return 0
+    return recipes.update(search_vector=recipe_search_vector())
+
+
+def recipe_ingredient_ids():
+    """Отсортированный массив id ингредиентов рецепта."""
+    return Array(
+        IngredientsRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by('ingredient_id').values('ingredient_id')
+    )
+
+
+def update_recipe_index(recipes):
+    """Пересчитать search_vector и ingredient_ids у рецептов одним UPDATE."""
+    if not is_postgresql(recipes):
+        return 0
+    return recipes.update(
+        search_vector=recipe_search_vector(),
+        ingredient_ids=recipe_ingredient_ids(),
+    )
+
+
+def schedule_recipe_index(recipe_id, using='default'):
+    """Пересчитать индекс рецепта после коммита транзакции.
+
+    Рецепты копятся в множестве соединения, и первый выполненный
+    обработчик on_commit пересчитывает их все одним UPDATE, так что
+    правка рецепта со всеми ингредиентами дает один запрос.
+    """
+    connection = connections[using]
+    if not hasattr(connection, 'recipe_index_pending'):
+        connection.recipe_index_pending = set()
+    connection.recipe_index_pending.add(recipe_id)
+
+    def flush():
+        pending = connection.recipe_index_pending
+        if pending:
+            connection.recipe_index_pending = set()
+            update_recipe_index(
+                Recipe.objects.using(using).filter(pk__in=pending)
+            )
+
+    transaction.on_commit(flush, using=using)
+
+
+def match_ingredients(queryset, ingredient_ids, max_missing=None):
+    """Рецепты, которые можно приготовить из ingredient_ids.
+
+    Кандидаты отбираются по GIN-индексу на ingredient_ids (оператор &&),
+    у каждого считается доля имеющихся ингредиентов (coverage) и число
+    недостающих (missing). Лучше покрытые рецепты идут первыми.
+    """
+    matched = MatchCount('ingredient_ids', list(ingredient_ids))
+    total = Cardinality('ingredient_ids')
+    queryset = queryset.filter(
+        ingredient_ids__overlap=list(ingredient_ids)
+    ).annotate(
+        matched=matched,
+        missing=total - matched,
+        coverage=Cast(matched, FloatField()) / Cast(total, FloatField()),
+    )
+    if max_missing is not None:
+        queryset = queryset.filter(missing__lte=max_missing)
+    return queryset.order_by('-coverage', 'missing', '-id')
+
+
+def search_recipes(queryset, value):
+    """Рецепты по полнотекстовому запросу, лучшие совпадения первыми.
+
+    Если по словам ничего не нашлось, например из-за опечатки, рецепты
+    ищутся по триграммному сходству названия.
+    """
+    if not is_postgresql(queryset):
+        return queryset.filter(
+            Q(name__icontains=value) | Q(text__icontains=value)
+        )
+    query = SearchQuery(value, config=SEARCH_CONFIG)
+    found = queryset.filter(search_vector=query)
+    if found.exists():
+        return found.annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+    return queryset.filter(name__trigram_similar=value).annotate(
+        similarity=TrigramSimilarity('name', value)
+    ).order_by('-similarity', '-id')
@@ -25,6 +25,11 @@ class User(AbstractUser):
     first_name = models.CharField('Имя', max_length=150, blank=False)
     last_name = models.CharField('Фамилия', max_length=150, blank=False)
     password = models.CharField('Пароль', max_length=150, blank=False)
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False,
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'last_name', 'first_name']
 
@@ -50,13 +55,15 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name='Подписчик',
-        related_name='follower'
+        related_name='follower',
+        db_index=False,
     )
     following = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         verbose_name='Автор',
-        related_name='following'
+        related_name='following',
+        db_index=False,
     )
 
     class Meta:
@@ -67,6 +74,13 @@ class Follow(models.Model):
                 fields=['user', 'following'], name="unique_followers"
             )
         ]
+        indexes = [
+            # Подписчики автора: рассылка ленты и счетчики.
+            models.Index(
+                fields=['following', 'user'],
+                name='follow_following_user_idx',
+            ),
+        ]
         ordering = ["-id"]
 
     def __str__(self):